@@ -0,0 +1,175 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmarks.synthetic import generate_corpus, write_company_labels
+from pipeline.keywords import INITIATIVES_FILE
+from pipeline.run import PARAMS, STAGES, run_stage
+from pipeline.sentences import open_sentence_store
+
+# Every scale is benchmarked in its own folder, cache/bench/<number of reports>, laid out like the repository
+# (data/type, data/companylabels.csv, data/esg_initiatives.csv) so the stages run unchanged
+BENCH_DIR = 'cache/bench'
+
+# Timings of a previous run, compared against by every run. Timings depend on the machine, so it is not committed:
+# the first run of each scale on a machine is saved as its baseline, --save-baseline replaces it
+BASELINE_FILE = 'benchmarks/baseline.json'
+
+SCALES = [100, 1000, 10000]
+
+# Stages of python -m pipeline.run that are timed, the lda stage trains a single model instead of the sweep
+BENCH_STAGES = [name for name in STAGES if name != 'publish']
+BENCH_PARAMS = {'lda': {'start': 10, 'limit': 11, 'step': 1, 'patience': None}}
+
+# A stage has regressed when it is slower (or uses more memory) than the baseline by more than this fraction,
+# stages shorter than MIN_SECONDS are too noisy to compare
+TOLERANCE = 0.25
+MIN_SECONDS = 0.5
+
+
+# function to run one stage and return its measurements, peak memory covers the worker processes started by the
+# stage (pdf extraction, spaCy, TextBlob), which are all joined before it returns
+def _measure_stage(name, params, run_dir):
+    meta = run_stage(name, '', params, run_dir)
+    return {key: meta[key] for key in ['seconds', 'cpu_seconds', 'peak_rss_mb', 'items']}
+
+
+def _prepare(n_reports, workspace, pages, sentences_per_page, seed):
+    os.makedirs(os.path.join(workspace, 'data'), exist_ok=True)
+    shutil.copy(INITIATIVES_FILE, os.path.join(workspace, INITIATIVES_FILE))
+    # results of a previous run would be read from the page and lemma caches
+    for directory in ['cache', 'model']:
+        shutil.rmtree(os.path.join(workspace, directory), ignore_errors=True)
+    os.makedirs(os.path.join(workspace, 'results'), exist_ok=True)
+
+    cwd = os.getcwd()
+    os.chdir(workspace)
+    try:
+        generate_corpus(n_reports, 'data/type', pages=pages, sentences_per_page=sentences_per_page, seed=seed)
+        write_company_labels(n_reports, 'data/companylabels.csv')
+    finally:
+        os.chdir(cwd)
+
+
+# function to benchmark every stage on a synthetic corpus of n_reports reports
+def benchmark(n_reports, bench_dir=BENCH_DIR, pages=4, sentences_per_page=25, seed=0):
+    workspace = os.path.abspath(os.path.join(bench_dir, str(n_reports)))
+    start = time.time()
+    _prepare(n_reports, workspace, pages, sentences_per_page, seed)
+    print('Generated %d reports in %.1fs' % (n_reports, time.time() - start))
+
+    params = {name: dict(PARAMS.get(name, {}), **BENCH_PARAMS.get(name, {})) for name in BENCH_STAGES}
+    stages = {}
+    cwd = os.getcwd()
+    os.chdir(workspace)
+    try:
+        os.makedirs('cache/run', exist_ok=True)
+        for name in BENCH_STAGES:
+            # spawned, so the memory of the benchmark process and of earlier stages is not counted
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+                stages[name] = executor.submit(_measure_stage, name, params[name], 'cache/run').result()
+            print('%-14s %8.2fs %8.2fs cpu %8.1f MB' % (name, stages[name]['seconds'], stages[name]['cpu_seconds'],
+                                                       stages[name]['peak_rss_mb']))
+        sentences = open_sentence_store().num_rows
+    finally:
+        os.chdir(cwd)
+
+    return {'reports': n_reports, 'pages': pages, 'sentences_per_page': sentences_per_page, 'sentences': sentences,
+            'cpus': os.cpu_count(), 'machine': platform.platform(), 'python': platform.python_version(),
+            'date': time.strftime('%Y-%m-%d %H:%M:%S'), 'stages': stages}
+
+
+def load_baseline(path=BASELINE_FILE):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_baseline(runs, path=BASELINE_FILE):
+    baseline = load_baseline(path)
+    baseline.update({str(run['reports']): run for run in runs})
+    with open(path, 'w') as f:
+        json.dump(baseline, f, indent=1, sort_keys=True)
+
+
+# function to compare a run with the baseline of the same scale, returns the stages that regressed
+def compare(run, baseline, tolerance=TOLERANCE):
+    regressions = []
+    print('\n%d reports, %d sentences' % (run['reports'], run['sentences']))
+    if baseline is None:
+        print('No baseline for this scale yet, this run is saved as its baseline')
+        return regressions
+    if (baseline['pages'], baseline['sentences_per_page']) != (run['pages'], run['sentences_per_page']):
+        print('Baseline was run on reports of a different size, timings are not comparable')
+        return regressions
+
+    print('%-14s %10s %10s %8s %10s %10s %8s' % ('stage', 'seconds', 'baseline', 'ratio', 'peak MB', 'baseline',
+                                              'ratio'))
+    for name, current in run['stages'].items():
+        previous = baseline['stages'].get(name)
+        if previous is None:
+            print('%-14s %10.2f %10s' % (name, current['seconds'], '-'))
+            continue
+        time_ratio = current['seconds'] / max(previous['seconds'], 1e-9)
+        memory_ratio = current['peak_rss_mb'] / max(previous['peak_rss_mb'], 1e-9)
+        slower = time_ratio > 1 + tolerance and current['seconds'] - previous['seconds'] > MIN_SECONDS
+        larger = memory_ratio > 1 + tolerance
+        if slower or larger:
+            regressions.append(name)
+        print('%-14s %10.2f %10.2f %8.2f %10.1f %10.1f %8.2f %s' % (
+            name, current['seconds'], previous['seconds'], time_ratio, current['peak_rss_mb'],
+            previous['peak_rss_mb'], memory_ratio, 'REGRESSION' if slower or larger else ''))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.bench',
+                                     description='Benchmark the pipeline stages on synthetic report corpora.')
+    parser.add_argument('--scales', nargs='+', type=int, default=SCALES, help='numbers of reports to benchmark')
+    parser.add_argument('--pages', type=int, default=4, help='pages per synthetic report')
+    parser.add_argument('--sentences-per-page', type=int, default=25)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                        help='fraction a stage may be slower or larger than the baseline')
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='store this run as the new baseline (the first run of a scale is always stored)')
+    args = parser.parse_args(argv)
+
+    baseline = load_baseline(args.baseline)
+    runs = []
+    regressions = []
+    for n_reports in args.scales:
+        run = benchmark(n_reports, pages=args.pages, sentences_per_page=args.sentences_per_page, seed=args.seed)
+        with open(os.path.join(BENCH_DIR, str(n_reports), 'report.json'), 'w') as f:
+            json.dump(run, f, indent=1)
+        runs.append(run)
+        regressions += ['%d:%s' % (n_reports, name)
+                        for name in compare(run, baseline.get(str(n_reports)), args.tolerance)]
+
+    if args.save_baseline:
+        save_baseline(runs, args.baseline)
+        print('\nSaved baseline to %s' % args.baseline)
+        return 0
+    first = [run for run in runs if str(run['reports']) not in baseline]
+    if first:
+        save_baseline(first, args.baseline)
+        print('\nSaved the first baseline of %s reports to %s' % (', '.join(str(run['reports']) for run in first),
+                                                                args.baseline))
+    if regressions:
+        print('\nRegressions: %s' % ', '.join(regressions))
+        return 1
+    return 0
+
+
+# python -m benchmarks.bench --scales 100 1000
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,99 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+
+from pipeline.bigrams import top_bigrams
+from pipeline.lemmas import lemmatize, load_nlp
+from pipeline.run import RUN_DIR, load_checkpoint, load_output
+from pipeline.sentences import load_sentences
+
+# Lemma caches of the check, emptied on every run so both pipelines parse every sentence
+CHECK_DIR = 'cache/bench/lemma_check'
+
+# spaCy components disabled by the bigram analysis before (the notebook only disabled ner) and now (load_nlp)
+PIPELINES = {'before': ('ner',), 'after': ('parser', 'ner')}
+
+
+# function to get the sentences of the bigram analysis: the decarbonization related sentences of the last
+# python -m pipeline.run, or every sentence of the store when the assign stage has not run yet
+def bigram_sentences(run_dir=RUN_DIR):
+    sentences = load_sentences(columns=['name', 'sentence'])
+    if load_checkpoint('assign', run_dir) is not None:
+        sentences = sentences[load_output('assign', run_dir)['esg'] == 'E']
+    return sentences.replace({np.nan: '-'}).reset_index(drop=True)
+
+
+# function to lemmatize the sentences and find the top k bigrams of each company with the given spaCy components
+# disabled, returns (lemmas, {company: [(bigram, score), ...]}, seconds)
+def run_pipeline(sentences, disable, k, n_process, check_dir=CHECK_DIR):
+    cache_path = os.path.join(check_dir, '-'.join(disable) + '.sqlite')
+    if os.path.exists(cache_path):
+        os.remove(cache_path)
+    start = time.time()
+    df = sentences.copy()
+    df['lemma'] = lemmatize(df['sentence'], nlp=load_nlp(disable), n_process=n_process, cache_path=cache_path)
+    seconds = time.time() - start
+    bigrams = top_bigrams(df, k=k)
+    return df['lemma'].tolist(), dict(zip(bigrams['name'], bigrams['bigramarray'])), seconds
+
+
+# function to compare the top k bigrams of both pipelines, returns the companies whose bigrams or scores differ
+def compare_bigrams(before, after):
+    differences = []
+    for company in sorted(set(before) | set(after)):
+        old, new = before.get(company, []), after.get(company, [])
+        same = [w for w, _ in old] == [w for w, _ in new] and np.allclose([s for _, s in old], [s for _, s in new])
+        if not same:
+            differences.append((company, old, new))
+    return differences
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.lemma_check',
+                                     description='Compare the bigram analysis with and without the spaCy parser.')
+    parser.add_argument('--k', type=int, default=10, help='bigrams per company')
+    parser.add_argument('--sample', type=int, default=None, help='only check this many sentences')
+    parser.add_argument('--n-process', type=int, default=os.cpu_count())
+    parser.add_argument('--output', help='json file to write the result to')
+    args = parser.parse_args(argv)
+
+    sentences = bigram_sentences()
+    if args.sample is not None and args.sample < len(sentences):
+        sentences = sentences.sample(args.sample, random_state=0).reset_index(drop=True)
+    shutil.rmtree(CHECK_DIR, ignore_errors=True)
+    os.makedirs(CHECK_DIR)
+
+    results = {name: run_pipeline(sentences, disable, args.k, args.n_process) for name, disable in PIPELINES.items()}
+    (lemmas_before, bigrams_before, seconds_before), (lemmas_after, bigrams_after, seconds_after) = \
+        results['before'], results['after']
+
+    changed = [i for i, (old, new) in enumerate(zip(lemmas_before, lemmas_after)) if old != new]
+    differences = compare_bigrams(bigrams_before, bigrams_after)
+    print('%d sentences of %d companies' % (len(sentences), sentences['name'].nunique()))
+    print('lemmatized in %.1fs with the parser, %.1fs without' % (seconds_before, seconds_after))
+    print('%d sentences lemmatized differently' % len(changed))
+    for i in changed[:5]:
+        print('  before: %s\n  after:  %s' % (lemmas_before[i], lemmas_after[i]))
+    print('%d companies with different top %d bigrams' % (len(differences), args.k))
+    for company, old, new in differences[:5]:
+        print('  %s\n    before: %s\n    after:  %s' % (company, [w for w, _ in old], [w for w, _ in new]))
+    if args.output:
+        nlp = load_nlp()
+        with open(args.output, 'w') as f:
+            json.dump({'model': nlp.meta['name'] + '-' + nlp.meta['version'], 'sentences': len(sentences),
+                       'companies': int(sentences['name'].nunique()), 'k': args.k,
+                       'seconds': {'before': seconds_before, 'after': seconds_after},
+                       'lemmas_changed': len(changed),
+                       'bigrams_changed': {company: {'before': [w for w, _ in old], 'after': [w for w, _ in new]}
+                                           for company, old, new in differences}}, f, indent=1)
+    return 1 if changed or differences else 0
+
+
+# python -m benchmarks.lemma_check --sample 5000
+if __name__ == '__main__':
+    sys.exit(main())
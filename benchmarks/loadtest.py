@@ -0,0 +1,239 @@
+import argparse
+import http.client
+import json
+import logging
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit
+
+import pandas as pd
+
+# Server side callbacks of dashboard.py and the dropdowns they take as inputs, in order
+CALLBACKS = {
+    'update_tab1': ['type_of_fi_dropdown_tab1', 'company_dropdown_tab1'],
+    'update_tab2': ['type_of_fi_dropdown_tab2', 'company_dropdown_tab2', 'company_dropdown2_tab2'],
+}
+
+PERCENTILES = [50, 95, 99]
+
+
+# function to read the companies of each type of FI, the options of the company dropdowns
+def load_companies(path='data/companylabels.csv'):
+    labels = pd.read_csv(path)
+    return {type_of_fi: sub_df['shortform'].tolist() for type_of_fi, sub_df in labels.groupby('type')}
+
+
+# function to find the outputs of every callback in the dependencies the dash renderer loads on start up
+def load_dependencies(connection):
+    connection.request('GET', '/_dash-dependencies')
+    response = connection.getresponse()
+    dependencies = json.loads(response.read())
+    callbacks = {}
+    for name, input_ids in CALLBACKS.items():
+        for dependency in dependencies:
+            if [i['id'] for i in dependency['inputs']] == input_ids and not dependency.get('clientside_function'):
+                callbacks[name] = dependency
+    missing = set(CALLBACKS) - set(callbacks)
+    if missing:
+        raise ValueError('callbacks not found in the dashboard: %s' % ', '.join(sorted(missing)))
+    return callbacks
+
+
+# function to build the body the dash renderer posts to _dash-update-component when one dropdown changes
+def update_request(dependency, values, changed):
+    outputs = [output.rsplit('.', 1) for output in dependency['output'].strip('.').split('...')]
+    inputs = [{'id': i['id'], 'property': i['property'], 'value': value}
+              for i, value in zip(dependency['inputs'], values)]
+    return {'output': dependency['output'],
+            'outputs': [{'id': id_, 'property': property_} for id_, property_ in outputs],
+            'inputs': inputs,
+            'changedPropIds': ['%s.%s' % (inputs[changed]['id'], inputs[changed]['property'])],
+            'state': []}
+
+
+# ---------- Interaction Sequences ----------
+# each yields (callback, values of its inputs, index of the input that changed), in the order an analyst
+# would change the dropdowns: the type of FI first (the company dropdown keeps its old value until a company of
+# the new type is picked), then a few companies of that type
+
+def tab1_session(rng, companies):
+    type_of_fi = rng.choice(sorted(companies))
+    company = rng.choice(companies[type_of_fi])
+    yield 'update_tab1', [type_of_fi, company], 0
+    for company in rng.sample(companies[type_of_fi], min(len(companies[type_of_fi]), rng.randint(2, 6))):
+        yield 'update_tab1', [type_of_fi, company], 1
+
+
+def tab2_session(rng, companies):
+    type_of_fi = rng.choice(sorted(fi for fi in companies if len(companies[fi]) > 1))
+    company1, company2 = rng.sample(companies[type_of_fi], 2)
+    yield 'update_tab2', [type_of_fi, company1, company2], 0
+    for _ in range(rng.randint(1, 3)):
+        company1 = rng.choice(companies[type_of_fi])
+        yield 'update_tab2', [type_of_fi, company1, company2], 1
+        for company2 in rng.sample(companies[type_of_fi], min(len(companies[type_of_fi]), rng.randint(1, 4))):
+            if company2 != company1:
+                yield 'update_tab2', [type_of_fi, company1, company2], 2
+
+
+# ---------- Load Test ----------
+# every user replays tab 1 and tab 2 sessions over its own keep-alive connection until the duration is over
+def _user(url, callbacks, companies, seed, deadline, think, tab2_share, samples):
+    rng = random.Random(seed)
+    parts = urlsplit(url)
+    connection = http.client.HTTPConnection(parts.hostname, parts.port, timeout=60)
+    headers = {'Content-Type': 'application/json', 'Accept': 'application/json'}
+    while time.time() < deadline:
+        session = tab2_session if rng.random() < tab2_share else tab1_session
+        for callback, values, changed in session(rng, companies):
+            if time.time() >= deadline:
+                break
+            body = json.dumps(update_request(callbacks[callback], values, changed))
+            start = time.perf_counter()
+            try:
+                connection.request('POST', parts.path.rstrip('/') + '/_dash-update-component', body, headers)
+                response = connection.getresponse()
+                response.read()
+                ok = response.status < 400
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                ok = False
+            samples.append((callback, time.perf_counter() - start, ok))
+            if think:
+                time.sleep(rng.uniform(0, think))
+    connection.close()
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return float('nan')
+    return sorted_values[min(len(sorted_values) - 1, max(0, int(round(p / 100 * len(sorted_values))) - 1))]
+
+
+# function to run the load test against a running dashboard, returns the latency percentiles of each callback
+def load_test(url, users=20, duration=60, think=0.0, tab2_share=0.5, seed=0, companies=None):
+    if companies is None:
+        companies = load_companies()
+    parts = urlsplit(url)
+    connection = http.client.HTTPConnection(parts.hostname, parts.port, timeout=60)
+    callbacks = load_dependencies(connection)
+    connection.close()
+
+    samples = []
+    deadline = time.time() + duration
+    threads = [threading.Thread(target=_user, args=(url, callbacks, companies, seed + i, deadline, think, tab2_share,
+                                                    samples), daemon=True) for i in range(users)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+
+    report = {'users': users, 'duration': round(elapsed, 2), 'requests': len(samples),
+              'throughput': round(len(samples) / elapsed, 2), 'callbacks': {}}
+    for callback in CALLBACKS:
+        latencies = sorted(1000 * seconds for name, seconds, ok in samples if name == callback and ok)
+        errors = sum(1 for name, _, ok in samples if name == callback and not ok)
+        stats = {'requests': len(latencies) + errors, 'errors': errors,
+                 'throughput': round((len(latencies) + errors) / elapsed, 2)}
+        stats.update({'p%d_ms' % p: round(percentile(latencies, p), 1) for p in PERCENTILES})
+        stats['max_ms'] = round(latencies[-1], 1) if latencies else float('nan')
+        report['callbacks'][callback] = stats
+    return report
+
+
+def print_report(report):
+    print('\n%d users, %d requests in %.1fs, %.1f requests/s' % (report['users'], report['requests'],
+                                                                report['duration'], report['throughput']))
+    print('%-12s %9s %7s %8s %9s %9s %9s %9s' % ('callback', 'requests', 'errors', 'req/s', 'p50 ms', 'p95 ms',
+                                               'p99 ms', 'max ms'))
+    for callback, stats in report['callbacks'].items():
+        print('%-12s %9d %7d %8.1f %9.1f %9.1f %9.1f %9.1f' % (
+            callback, stats['requests'], stats['errors'], stats['throughput'], stats['p50_ms'], stats['p95_ms'],
+            stats['p99_ms'], stats['max_ms']))
+
+
+# ---------- Local Server ----------
+# the dashboard is started with gunicorn when workers are given (as deployed), otherwise with the threaded
+# development server in this process. Figures are cached in a new folder, so every run starts from a cold cache
+
+def _wait_until_up(url, timeout=120):
+    parts = urlsplit(url)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            connection = http.client.HTTPConnection(parts.hostname, parts.port, timeout=5)
+            connection.request('GET', '/_dash-layout')
+            if connection.getresponse().status == 200:
+                return
+        except OSError:  # not listening yet
+            pass
+        time.sleep(0.5)
+    raise TimeoutError('dashboard did not start within %ds' % timeout)
+
+
+def start_server(port, workers=None, figure_cache=None):
+    env = dict(os.environ, FIGURE_CACHE_DIR=figure_cache)
+    if workers:
+        process = subprocess.Popen(['gunicorn', 'dashboard:server', '--workers', str(workers),
+                                    '--bind', '127.0.0.1:%d' % port], env=env)
+        return process.terminate
+
+    os.environ['FIGURE_CACHE_DIR'] = figure_cache
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)  # one line per request otherwise
+    from werkzeug.serving import make_server
+
+    from dashboard import server
+    httpd = make_server('127.0.0.1', port, server, threaded=True)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd.shutdown
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.loadtest',
+                                     description='Replay tab 1 and tab 2 interactions against the dashboard.')
+    parser.add_argument('--url', help='dashboard to test, eg. http://127.0.0.1:8050 (default: start one locally)')
+    parser.add_argument('--workers', type=int, help='start the dashboard with this many gunicorn workers')
+    parser.add_argument('--port', type=int, default=8060, help='port of the dashboard started locally')
+    parser.add_argument('--figure-cache', help='figure cache of the dashboard started locally (default: empty)')
+    parser.add_argument('--users', type=int, default=20, help='number of analysts using the dashboard at once')
+    parser.add_argument('--duration', type=float, default=60, help='seconds to run the test for')
+    parser.add_argument('--think', type=float, default=0.0, help='maximum seconds between two interactions')
+    parser.add_argument('--tab2-share', type=float, default=0.5, help='fraction of sessions on the comparison tab')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='json file to write the report to')
+    args = parser.parse_args(argv)
+
+    url = args.url
+    stop = None
+    cache_dir = None
+    if url is None:
+        url = 'http://127.0.0.1:%d' % args.port
+        cache_dir = args.figure_cache or tempfile.mkdtemp(prefix='figures-')
+        stop = start_server(args.port, args.workers, cache_dir)
+    try:
+        _wait_until_up(url)
+        report = load_test(url, users=args.users, duration=args.duration, think=args.think,
+                           tab2_share=args.tab2_share, seed=args.seed)
+    finally:
+        if stop is not None:
+            stop()
+        if cache_dir is not None and args.figure_cache is None:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=1)
+
+
+# python -m benchmarks.loadtest --users 30 --duration 60
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,118 @@
+import json
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz
+import pandas as pd
+
+from pipeline.extraction import fi_folders
+from pipeline.keywords import INITIATIVES_FILE
+
+# Synthetic reports look like the sustainability reports in data/type: a mix of decarbonization, social,
+# governance and financial sentences per company, mentioning initiatives from data/esg_initiatives.csv, so every
+# stage of the pipeline (LDA topics, initiatives, bigrams, sentiment) has something to find
+YEARS = [2016, 2017, 2018, 2019, 2020]
+
+VOCABULARY = {
+    'E': ['carbon emissions', 'greenhouse gas emissions', 'net zero target', 'renewable energy', 'climate change',
+          'coal financing', 'decarbonisation pathway', 'low carbon transition', 'green bonds', 'solar projects',
+          'wind farms', 'energy efficiency', 'scope 3 emissions', 'fossil fuel exposure', 'climate risk',
+          'carbon footprint', 'sustainable finance', 'transition plan', 'physical risk', 'carbon intensity'],
+    'S': ['employee wellbeing', 'diversity and inclusion', 'community programmes', 'staff training',
+          'customer satisfaction', 'financial literacy', 'volunteering hours', 'health and safety',
+          'human rights', 'talent development'],
+    'G': ['board oversight', 'audit committee', 'risk management framework', 'executive remuneration',
+          'corporate governance', 'regulatory compliance', 'shareholder engagement', 'independent directors',
+          'anti corruption policy', 'internal controls'],
+    'F': ['net interest margin', 'loan portfolio', 'assets under management', 'gross written premiums',
+          'dividend payout', 'operating income', 'capital adequacy ratio', 'cost to income ratio',
+          'fee income', 'investment returns'],
+}
+
+POSITIVE = ['strong', 'significant', 'improved', 'successful', 'good', 'robust', 'excellent', 'positive']
+NEGATIVE = ['weak', 'poor', 'difficult', 'negative', 'uncertain', 'challenging', 'slow', 'disappointing']
+VERBS = ['increased', 'reduced', 'strengthened', 'expanded', 'reported', 'supported', 'achieved', 'reviewed',
+         'disclosed', 'measured']
+CLAUSES = ['in line with the expectations of our stakeholders', 'across all of our markets in the region',
+           'as part of our long term strategy for the group', 'compared with the previous financial year',
+           'together with our clients and investee companies', 'which remains a priority for the board']
+
+
+def company_names(n_companies):
+    return ['Synthetic%05d' % i for i in range(n_companies)]
+
+
+# function to list the reports of a synthetic corpus as (type, companyname, year), companies are spread evenly
+# over the types of FI and every company has one report per year
+def synthetic_reports(n_reports):
+    n_companies = max(1, -(-n_reports // len(YEARS)))
+    fis = sorted(fi_folders)
+    reports = [(fis[i % len(fis)], name, year) for i, name in enumerate(company_names(n_companies)) for year in YEARS]
+    return reports[:n_reports]
+
+
+def _sentence(rng, company, year, topic, initiatives):
+    adjective = rng.choice(POSITIVE if rng.random() < 0.6 else NEGATIVE)
+    words = VOCABULARY[topic]
+    sentence = '%s %s its %s %s and %s %s, %s' % (company, rng.choice(VERBS), adjective, rng.choice(words),
+                                                rng.choice(words), rng.choice(CLAUSES), rng.choice(CLAUSES))
+    if rng.random() < 0.05:
+        sentence += ', as a member of the %s' % rng.choice(initiatives)
+    return sentence + ' in %d.' % year
+
+
+# function to generate the text of each page of one report, each report has its own mix of topics
+def generate_report(rng, company, year, pages, sentences_per_page, initiatives):
+    topics = list(VOCABULARY)
+    weights = [rng.gammavariate(0.5, 1) for _ in topics]
+    return [' '.join(_sentence(rng, company, year, rng.choices(topics, weights)[0], initiatives)
+                     for _ in range(sentences_per_page)) for _ in range(pages)]
+
+
+def write_pdf(path, pages):
+    with fitz.open() as doc:
+        for text in pages:
+            page = doc.new_page()
+            page.insert_textbox(page.rect + (36, 36, -36, -36), text, fontsize=7)
+        doc.save(path)
+
+
+def _write_reports(jobs, pages, sentences_per_page, initiatives, seed):
+    for index, path, company, year in jobs:
+        rng = random.Random('%d-%d' % (seed, index))
+        write_pdf(path, generate_report(rng, company, year, pages, sentences_per_page, initiatives))
+
+
+# function to write a synthetic corpus as pdfs in data_dir/<FI folder>/<company>-<year>.pdf, laid out like data/type
+# reports are only written again when the parameters of the corpus change
+def generate_corpus(n_reports, data_dir, pages=4, sentences_per_page=25, seed=0, max_workers=None):
+    params = {'n_reports': n_reports, 'pages': pages, 'sentences_per_page': sentences_per_page, 'seed': seed}
+    params_file = os.path.join(data_dir, 'corpus.json')
+    if os.path.exists(params_file):
+        with open(params_file) as f:
+            if json.load(f) == params:
+                return
+    for folder in fi_folders.values():
+        directory = os.path.join(data_dir, folder)
+        os.makedirs(directory, exist_ok=True)
+        for filename in os.listdir(directory):
+            os.remove(os.path.join(directory, filename))
+
+    initiatives = pd.read_csv(INITIATIVES_FILE)['Initiative'].tolist()
+    jobs = [(index, os.path.join(data_dir, fi_folders[fi], '%s-%d.pdf' % (company, year)), company, year)
+            for index, (fi, company, year) in enumerate(synthetic_reports(n_reports))]
+    chunks = [jobs[i:i + 100] for i in range(0, len(jobs), 100)]
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for future in [executor.submit(_write_reports, chunk, pages, sentences_per_page, initiatives, seed)
+                       for chunk in chunks]:
+            future.result()
+    with open(params_file, 'w') as f:
+        json.dump(params, f)
+
+
+# function to write the company labels of a synthetic corpus, read by the stopwords of the cleaning stage
+def write_company_labels(n_reports, path):
+    companies = sorted({(company, fi) for fi, company, _ in synthetic_reports(n_reports)})
+    pd.DataFrame([(company, company, fi) for company, fi in companies],
+                 columns=['fullname', 'shortform', 'type']).to_csv(path, index=False)
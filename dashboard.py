@@ -1,5 +1,9 @@
-import ast
+import hashlib
+import os
+import pickle
 import random
+import threading
+import time
 import numpy as np
 import pandas as pd
 import plotly as py
@@ -12,7 +16,12 @@ import dash.dependencies as dd
 import dash_core_components as dcc
 import dash_html_components as html
 import dash_bootstrap_components as dbc 
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State
+
+from dashboard_metrics import add_metrics_route, time_callback, time_figure
+from figure_cache import FIGURE_CACHE_DIR, FigureCache
+from pipeline.results import current_version, load_table
+from pipeline.sentence_index import SENTENCE_INDEX_DIR, load_sentence_index
 
 # Bootstrap --------------------------------------------------------------------------
 app = dash.Dash(__name__, external_stylesheets=[dbc.themes.MATERIA], 
@@ -22,6 +31,9 @@ app = dash.Dash(__name__, external_stylesheets=[dbc.themes.MATERIA],
 
 server = app.server
 
+# Prometheus metrics of the callbacks and figures, see dashboard_metrics.py
+add_metrics_route(server)
+
 # Load Data --------------------------------------------------------------------------
 # Load company names to display in dropdown menu
 companylabels_file = pd.read_csv('data/companylabels.csv', usecols=['fullname', 'shortform', 'type'])
@@ -35,17 +47,190 @@ initiatives_file = pd.read_csv('data/esg_initiatives.csv')
 initiatives_file = initiatives_file.replace({np.nan: '-'})
 # dictionary: key-initiative spelled out fully, value-[acronym, description]
 initiatives_dict = initiatives_file.set_index('Initiative').T.to_dict('list')
-# read csv containing all initiatives
-all_initiative_array = pd.read_csv('results/all_initiatives.csv', usecols=['name', 'initiatives', 'count', 'type'])
-
-# For decarbonization percentage
-ratings_file = pd.read_csv('results/all_percent.csv', usecols=['name', 'percent', 'type'])
 
-# For sentiment 
-sentiment_file = pd.read_csv('results/sentiment_score.csv', usecols=['name', 'predicted_sentiment_tree', 'type'])
-
-# For bigram
-bigram_file = pd.read_csv('results/bigram_df.csv', usecols=['name', 'bigramarray'])
+# Metric Index -----------------------------------------------------------------------
+# The tables of a version of the results stay memory-mapped Arrow tables. Loading a version only maps each company
+# (or type of FI) to its rows; callbacks read the values of the company they need from the columns on request.
+class Rows:
+    def __init__(self, table, key):
+        self.table = table
+        keys = table.column(key).combine_chunks()
+        names = keys.dictionary.to_pylist()
+        self.rows = {}
+        for row, code in enumerate(keys.indices.to_numpy()):
+            self.rows.setdefault(names[code], []).append(row)
+
+    # value of a column in the row of key, KeyError for a key missing from the table
+    def value(self, key, column):
+        return self.table.column(column)[self.rows[key][-1]].as_py()
+
+    # values of a column in every row of key, in table order
+    def values(self, key, column):
+        values = self.table.column(column)
+        return [values[row].as_py() for row in self.rows[key]]
+
+# values of a column for one type of FI
+def fi_values(table, column, type_of_fi):
+    types = table.column('type').combine_chunks()
+    names = types.dictionary.to_pylist()
+    if type_of_fi not in names:
+        return []
+    return table.column(column).to_numpy()[types.indices.to_numpy() == names.index(type_of_fi)].tolist()
+
+def build_fi_averages(initiatives, percent, sentiment):
+    averages = {}
+    for type_of_fi in fi_dict:
+        sentiment_array = fi_values(sentiment, 'predicted_sentiment_tree', type_of_fi)
+        percent_array = fi_values(percent, 'percent', type_of_fi)
+        count_array = fi_values(initiatives, 'count', type_of_fi)
+        averages[type_of_fi] = {
+            'sentiment': round(sum(sentiment_array) / len(sentiment_array), 2) if sentiment_array else 0,
+            'percent': round(sum(percent_array) / len(percent_array), 2) if percent_array else 0,
+            'initiative_count': round(sum(count_array) / len(count_array)) if count_array else 0}
+    return averages
+
+# Year-over-year series of each company (key 'name') or of the average of each type of FI (key 'type'),
+# read in year order from the rollup cube published with the results
+trend_measures = ['percent', 'sentiment', 'initiative_count']
+trend_columns = ['year'] + trend_measures + [measure + '_yoy' for measure in trend_measures]
+
+# Results of one published version (see pipeline/results.py). Only the averages of each type of FI are computed
+# when it is loaded, everything per company is read from the memory-mapped tables
+class Results:
+    def __init__(self, version):
+        self.version = version
+        initiatives = load_table('initiatives', version)
+        percent = load_table('percent', version)
+        sentiment = load_table('sentiment', version)
+        self.initiatives = Rows(initiatives, 'name')
+        self.percent = Rows(percent, 'name')
+        self.sentiment = Rows(sentiment, 'name')
+        self.bigrams = Rows(load_table('bigrams', version), 'name')
+        self.fi_averages = build_fi_averages(initiatives, percent, sentiment)
+        try:
+            self.company_trends = Rows(load_table('trends', version), 'name')
+            self.fi_trends = Rows(load_table('fi_trends', version), 'type')
+        except FileNotFoundError:  # published without trends, the trend charts are hidden
+            self.company_trends = self.fi_trends = None
+
+    def company_sentiment(self, company):
+        return round(self.sentiment.value(company, 'predicted_sentiment_tree'), 2)
+
+    def company_percent(self, company):
+        return round(self.percent.value(company, 'percent'), 2)
+
+    # initiatives mentioned by the company, sorted
+    def company_initiatives(self, company):
+        return sorted(self.initiatives.value(company, 'initiatives'))
+
+    # (bigrams, scores) of the company
+    def company_bigrams(self, company):
+        bigram_dict = self.bigrams.value(company, 'bigramarray')
+        return [w['bigram'] for w in bigram_dict], [round(w['score'],3) for w in bigram_dict]
+
+    # {column: values in year order} of a company or of the average of a type of FI
+    def company_trend(self, company):
+        return self.trend(self.company_trends, company)
+
+    def fi_trend(self, type_of_fi):
+        return self.trend(self.fi_trends, type_of_fi)
+
+    # whether the cube of this version has rows for the company, KeyError for a company missing from the results
+    def has_trend(self, company):
+        if company not in self.percent.rows:
+            raise KeyError(company)
+        return self.company_trends is not None and company in self.company_trends.rows
+
+    @staticmethod
+    def trend(rows, key):
+        if rows is None:
+            raise KeyError(key)
+        return {column: rows.values(key, column) for column in trend_columns}
+
+    # figures are cached per version of the results
+    def __str__(self):
+        return self.version
+
+# Hot Reload -------------------------------------------------------------------------
+# Each worker checks results/CURRENT at most every RELOAD_INTERVAL seconds. A newly published version is
+# loaded (and its figures pre-rendered if warm up is on) in the background, then swapped in without a restart
+RELOAD_INTERVAL = 5
+
+results = Results(current_version())
+reload_lock = threading.Lock()
+last_check = time.monotonic()
+
+def reload_results(version):
+    global results
+    try:
+        new_results = Results(version)
+        if os.environ.get('WARM_UP_FIGURE_CACHE'):
+            warm_up_figure_cache(new_results)
+        results = new_results
+    finally:
+        reload_lock.release()
+
+def current_results():
+    global last_check
+    if time.monotonic() - last_check > RELOAD_INTERVAL and reload_lock.acquire(blocking=False):
+        last_check = time.monotonic()
+        version = current_version()
+        if version is not None and version != results.version:
+            threading.Thread(target=reload_results, args=(version,), daemon=True).start()
+        else:
+            reload_lock.release()
+    return results
+
+# Sentence Index ---------------------------------------------------------------------
+# Index of the Similar Sentences tab (see pipeline/sentence_index.py). Each build is a new version named in
+# results/sentence_index/CURRENT, reopened by each worker once it changes. A version that cannot be opened is logged
+# and not retried, the previous one is searched until the next build
+sentence_index = None
+failed_sentence_index = None
+
+def current_sentence_index():
+    global sentence_index, failed_sentence_index
+    version = current_version(SENTENCE_INDEX_DIR)
+    if version is None or version == failed_sentence_index:
+        return sentence_index
+    if sentence_index is None or sentence_index.version != version:
+        try:
+            sentence_index = load_sentence_index(version)
+        except (OSError, ValueError, EOFError, pickle.UnpicklingError):
+            server.logger.exception('cannot open version %s of the sentence index', version)
+            failed_sentence_index = version
+    return sentence_index
+
+# Years of the sentences in the current index, computed once per version
+index_years = {}
+
+def sentence_years():
+    index = current_sentence_index()
+    if index is None:
+        return []
+    if index.version not in index_years:
+        index_years.clear()
+        index_years[index.version] = [int(y) for y in np.unique(index.years)]
+    return index_years[index.version]
+
+# Options of the company dropdowns for each type of FI
+company_options = {type_of_fi: [{'label': x[0], 'value': x[1]} for x in sub_df[['fullname', 'shortform']].values.tolist()]
+                   for type_of_fi, sub_df in companylabels_file.groupby('type')}
+
+# Figure Cache -----------------------------------------------------------------------
+# Figures are keyed on the version of the results (an argument of every figure) and of the data files below,
+# identified by their sizes and modification times
+data_files = ['data/companylabels.csv', 'data/esg_initiatives.csv']
+
+def data_version():
+    sha = hashlib.sha1()
+    for path in data_files:
+        stat = os.stat(path)
+        sha.update(('%s %d %d\n' % (path, stat.st_size, stat.st_mtime_ns)).encode('utf-8'))
+    return sha.hexdigest()
+
+# Shared by the gunicorn workers through the cache folder, figures of older versions are no longer looked up
+figure_cache = FigureCache(os.environ.get('FIGURE_CACHE_DIR', FIGURE_CACHE_DIR), version=data_version())
 
 # Cards --------------------------------------------------------------------------------
 card_sentiment = dbc.Card([
@@ -120,8 +305,37 @@ card_bigram_comparison2 = dbc.Card([
     ])
 ])
 
+card_trends = dbc.Card([
+    dbc.CardBody([
+        html.H5('Year-over-Year Trends', className='card-header text-center'),
+        dcc.Graph(id='trend_chart', figure={})
+    ])
+])
+
+card_trend_comparison = dbc.Card([
+    dbc.CardBody([
+        html.H5('Comparison - Year-over-Year Trends', className='card-header text-center'),
+        dcc.Graph(id='trend_comparison', figure={})
+    ])
+])
+
 alert = dbc.Alert('No decarbonisation related bigrams to display!', color='danger', className='text-center', dismissable=True)
 
+card_similar_sentences = dbc.Card([
+    dbc.CardBody([
+        html.H5('Most Similar Decarbonization Related Sentences', className='card-header text-center'),
+        html.Div(id="alert_similar", children=[]),
+        html.Div(id='similar_sentences', children=[]),
+        html.P('Similarity is the cosine similarity of the TF-IDF vectors of the sentences, \
+                reduced to their main components', className='card-footer')
+    ])
+])
+
+alert_no_index = dbc.Alert('The sentence index has not been built yet, run python -m pipeline.run', color='danger',
+                           className='text-center', dismissable=True)
+alert_no_match = dbc.Alert('No sentences match the selected filters!', color='danger', className='text-center',
+                           dismissable=True)
+
 # Tabs ------------------------------------------------------------------------------
 tab1_content = dbc.Card(
     dbc.CardBody([
@@ -157,6 +371,13 @@ tab1_content = dbc.Card(
             dbc.Col([card_initiative_table], width={'size':7, 'offset':0, 'order':1}),
             dbc.Col([card_bigram], width={'size':5, 'offset':0, 'order':2})
         ]),
+        # hidden until the published results have a rollup cube, see render_trends
+        html.Div([
+            html.Br(),
+            dbc.Row([
+                dbc.Col([card_trends], width=12)
+            ])
+        ], id='trend_panel', style={'display': 'none'}),
         html.Br(),
         dbc.Row([
             dbc.Col([html.P('* Average is the mean result of all the companies that belongs \
@@ -206,6 +427,12 @@ tab2_content = dbc.Card(
             dbc.Col([card_bigram_comparison1], width={'size':6, 'offset':0, 'order':1}),
             dbc.Col([card_bigram_comparison2], width={'size':6, 'offset':0, 'order':2})
         ]),
+        html.Div([
+            html.Br(),
+            dbc.Row([
+                dbc.Col([card_trend_comparison], width=12)
+            ])
+        ], id='trend_comparison_panel', style={'display': 'none'}),
         html.Br(),
         dbc.Row([
             dbc.Col([html.P('* Average is the mean result of all the companies that belongs \
@@ -217,47 +444,91 @@ tab2_content = dbc.Card(
 )
 
 
-tabs = dbc.Tabs([
-    dbc.Tab(tab1_content, label="Individual Company"),
-    dbc.Tab(tab2_content, label="Company Comparison")
-])
-
-# Layout -----------------------------------------------------------------------------
-app.layout = dbc.Container([
-    html.Br(),
-    dbc.Row([ # First Row: Dashboard Header
-        dbc.Col(html.H1('Decarbonization Dashboard', className='font-weight-bolder'), width=12)
+tab3_content = dbc.Card(
+    dbc.CardBody([
+        dbc.Row([
+            dbc.Col([
+                html.H6('Enter a Sentence'),
+                dbc.Input(id='sentence_input', type='text', debounce=True,
+                          placeholder='eg. We commit to net zero emissions across our portfolio by 2050')
+            ], width={'size':10, 'offset':0, 'order':1}),
+            dbc.Col([
+                html.H6('Results'),
+                dcc.Dropdown(id='k_dropdown',
+                            options=[{'label': str(k), 'value': k} for k in [10, 25, 50]],
+                            multi=False,
+                            value=10,
+                            clearable=False,
+                            searchable=False)
+            ], width={'size':2, 'offset':0, 'order':2})
+        ]),
+        html.Br(),
+        dbc.Row([
+            dbc.Col([
+                html.H6('Filter by Type of Financial Institution'),
+                dcc.Dropdown(id='type_of_fi_dropdown_tab3',
+                            options=[
+                                {'label': 'Asset Manager (AM)', 'value': 'am'},
+                                {'label': 'Asian Bank (AB)', 'value': 'ab'},
+                                {'label': 'Insurance Company (INS)', 'value': 'ins'},
+                                {'label': 'Pension Fund (PF)', 'value': 'pf'}
+                            ],
+                            multi=True,
+                            searchable=False)
+            ], width={'size':4, 'offset':0, 'order':1}),
+            dbc.Col([
+                html.H6('Filter by Company'),
+                dcc.Dropdown(id='company_dropdown_tab3',
+                            multi=True)
+            ], width={'size':4, 'offset':0, 'order':2}),
+            dbc.Col([
+                html.H6('Filter by Year'),
+                dcc.Dropdown(id='year_dropdown_tab3',
+                            multi=True)
+            ], width={'size':4, 'offset':0, 'order':3})
+        ]),
+        html.Br(),
+        dbc.Row([
+            dbc.Col([card_similar_sentences], width=12)
+        ])
     ]),
-    html.Br(),
-    dbc.Row([
-        dbc.Col([tabs])
-    ])
-], fluid=True)
-
-# Callback ----------------------------------------------------------------------------
-# To filter for comapanies according to FI chosen 
-@app.callback(
-    Output(component_id='company_dropdown_tab1', component_property='options'),
-    Input(component_id='type_of_fi_dropdown_tab1', component_property='value')
+    className="mt-3",
 )
-def update_dropdown_tab1(type_of_fi):
-    sub_df = companylabels_file.loc[companylabels_file['type'] == type_of_fi]
-    options = [{'label': x[0], 'value': x[1]} for x in sub_df.values.tolist()]
-    return options
 
-# To update sentiment gauge chart
-@app.callback(
-    Output(component_id='sentiment_gauge', component_property='figure'),
-    Input(component_id='type_of_fi_dropdown_tab1', component_property='value'),
-    Input(component_id='company_dropdown_tab1', component_property='value')
-)
-def update_graph_tab1_sentiment(type_of_fi, company):
-    # Extract out dataframe for relevant FI, used for aggregation
-    sub_df = sentiment_file.loc[sentiment_file['type'] == type_of_fi]
-    count_array = sub_df['predicted_sentiment_tree'].values.tolist()
+tabs = dbc.Tabs([
+    dbc.Tab(tab1_content, label="Individual Company"),
+    dbc.Tab(tab2_content, label="Company Comparison"),
+    dbc.Tab(tab3_content, label="Similar Sentences", tab_id='tab3')
+], id='tabs')
 
-    sentiment = round(sentiment_file.set_index('name').predicted_sentiment_tree.loc[company], 2)
-    average = round(sum(count_array) / len(count_array), 2)
+# Layout -----------------------------------------------------------------------------
+# Served on every page load, so the years of the Similar Sentences tab are those of the index built last
+def serve_layout():
+    return dbc.Container([
+        # [fullname, shortform, type] of every company, used to filter the company dropdowns in the browser
+        dcc.Store(id='company_labels', data=companylabels_file[['fullname', 'shortform', 'type']].values.tolist()),
+        # years of the sentences in the current index, the options of the year dropdown of tab 3
+        dcc.Store(id='sentence_years', data=sentence_years()),
+        html.Br(),
+        dbc.Row([ # First Row: Dashboard Header
+            dbc.Col(html.H1('Decarbonization Dashboard', className='font-weight-bolder'), width=12)
+        ]),
+        html.Br(),
+        dbc.Row([
+            dbc.Col([tabs])
+        ])
+    ], fluid=True)
+
+app.layout = serve_layout
+
+# Figures -----------------------------------------------------------------------------
+# Built once per set of inputs, see Figure Cache
+# Sentiment gauge chart
+@figure_cache.memoize
+@time_figure
+def sentiment_gauge(results, type_of_fi, company):
+    sentiment = results.company_sentiment(company)
+    average = results.fi_averages[type_of_fi]['sentiment']
     fig = go.Figure(go.Indicator(
         domain = {'x': [0, 1], 'y': [0, 1]},
         value = sentiment, # company's sentiment
@@ -274,19 +545,12 @@ def update_graph_tab1_sentiment(type_of_fi, company):
     fig.update_layout(height = 200, margin = {'t':10, 'b':0})
     return fig
 
-# To update barplot for percentage disclosure
-@app.callback(
-    Output(component_id='percentage_barplot', component_property='figure'),
-    Input(component_id='type_of_fi_dropdown_tab1', component_property='value'),
-    Input(component_id='company_dropdown_tab1', component_property='value')
-)
-def update_graph_tab1_percentage(type_of_fi, company):
-    # Extract out dataframe for relevant FI, used for aggregation
-    sub_df = ratings_file.loc[ratings_file['type'] == type_of_fi]
-    count_array = sub_df['percent'].values.tolist()
-
-    rating = round(ratings_file.set_index('name').percent.loc[company], 2)
-    average = round(sum(count_array) / len(count_array), 2)
+# Barplot for percentage disclosure
+@figure_cache.memoize
+@time_figure
+def percentage_barplot(results, type_of_fi, company):
+    rating = results.company_percent(company)
+    average = results.fi_averages[type_of_fi]['percent']
     fig = go.Figure(go.Bar(
             x=[average, rating],
             y=['Average' + ' (' + fi_dict[type_of_fi] + ')*', company],
@@ -298,20 +562,12 @@ def update_graph_tab1_percentage(type_of_fi, company):
     fig.update_layout(height = 200 , margin = {'t':10, 'b':0, 'r':10})
     return fig 
 
-# To update barplot for initiative count
-@app.callback(
-    Output(component_id='initiative_barplot', component_property='figure'),
-    Input(component_id='type_of_fi_dropdown_tab1', component_property='value'),
-    Input(component_id='company_dropdown_tab1', component_property='value')
-)
-def update_graph_tab1_initiativecount(type_of_fi, company):
-    # Extract out dataframe for relevant FI, used for aggregation
-    sub_df = all_initiative_array.loc[all_initiative_array['type'] == type_of_fi]
-    count_array = sub_df['count'].values.tolist()
-
-    company_initiative = all_initiative_array.set_index('name').initiatives.loc[company]
-    count = len(ast.literal_eval(company_initiative))
-    average = round(sum(count_array) / len(count_array))
+# Barplot for initiative count
+@figure_cache.memoize
+@time_figure
+def initiative_barplot(results, type_of_fi, company):
+    count = len(results.company_initiatives(company))
+    average = results.fi_averages[type_of_fi]['initiative_count']
     fig = go.Figure(go.Bar(
             x=[average, count],
             y=['Average' + ' (' + fi_dict[type_of_fi] + ')*', company],
@@ -323,23 +579,14 @@ def update_graph_tab1_initiativecount(type_of_fi, company):
     fig.update_layout(height = 200 , margin = {'t':10, 'b':0, 'r':10})
     return fig 
 
-# To update Global Initiatives Table
-@app.callback(
-    Output(component_id='initiative_table', component_property='figure'),
-    Input(component_id='company_dropdown_tab1', component_property='value')
-)
-def update_graph_tab1_initiativetable(company):
-    company_initiative = all_initiative_array.set_index('name').initiatives.loc[company]
-    company_initiative = ast.literal_eval(company_initiative)
-    company_initiative = sorted(company_initiative)
-    
-    data = []
-    for full_name in company_initiative:
-        acronym = initiatives_dict[full_name][0]
-        details = initiatives_dict[full_name][1]  
-        data.append([full_name, acronym, details])
-    
-    df = pd.DataFrame(data, columns = ['Initiatives', 'Acronym', 'Details'])
+# Global Initiatives Table
+@figure_cache.memoize
+@time_figure
+def initiative_table(results, company):
+    company_initiative = results.company_initiatives(company)
+    table_values = [company_initiative,
+                    [initiatives_dict[full_name][0] for full_name in company_initiative],
+                    [initiatives_dict[full_name][1] for full_name in company_initiative]]
 
     fig = go.Figure(data=[go.Table(
         columnwidth = [100, 60, 400],
@@ -349,7 +596,7 @@ def update_graph_tab1_initiativetable(company):
             fill_color='rgb(176, 242, 188)',
             align='left'),
         cells = dict(
-            values=[df.Initiatives, df.Acronym, df.Details],
+            values=table_values,
             fill_color='white', 
             font_color='rgb(100,100,100)',
             font_size=10,
@@ -358,23 +605,18 @@ def update_graph_tab1_initiativetable(company):
     ], layout=go.Layout(margin={'l':0, 'r':0, 't':10, 'b':10}))
     return fig
 
-# To update bigram chart 
-@app.callback(
-    Output(component_id='bigram', component_property='figure'),
-    Output(component_id='alert', component_property='children'),
-    Input(component_id='company_dropdown_tab1', component_property='value')
-)
-def update_graph_tab1_bigram(company):
+# Bigram chart of a company and whether it has any decarbonization related bigrams
+# tab 2 shows the name of the company as the title of the chart
+@figure_cache.memoize
+@time_figure
+def bigram_figure(results, company, title=None):
     try:
-        bigram_dict = bigram_file.set_index('name').bigramarray.loc[company]
-        bigram_dict = ast.literal_eval(bigram_dict)
-        words = [w[0] for w in bigram_dict]
-        counts = [round(w[1],3) for w in bigram_dict]
-        alert_notification = dash.no_update
+        words, counts = results.company_bigrams(company)
+        available = True
     except KeyError:
         words = [0]
         counts = ['No Decarbonization-Related Bigrams Available']
-        alert_notification = alert
+        available = False
 
     fig = go.Figure(go.Bar(
             x=counts,
@@ -383,46 +625,88 @@ def update_graph_tab1_bigram(company):
             marker_color=px.colors.sequential.Tealgrn,
             text=counts,
             textposition='inside'))
-    fig.update_layout(height = 450 , margin = {'t':10, 'b':0, 'r':10, 'l':10}, yaxis=dict(autorange="reversed"))
-    return fig, alert_notification
+    if title is None:
+        fig.update_layout(height = 450 , margin = {'t':10, 'b':0, 'r':10, 'l':10}, yaxis=dict(autorange="reversed"))
+    else:
+        fig.update_layout(height = 450 , margin = {'t':60, 'b':0, 'r':10}, yaxis=dict(autorange="reversed"), 
+                        title_text=title, title_font_size=13, title_x=0.5)
+    return fig, available
+
+# Year-over-year charts of disclosure, sentiment and initiative count, one line per company and a dashed line for
+# the average of the type of FI. Hovering a year shows its change since the previous report year (for the average,
+# the change of the companies with reports in both years)
+trend_titles = ['Decarbonization Disclosure (%)', 'Overall Sentiment Level', 'Global Standards & Initiatives Count']
+
+def trend_change(change, previous):
+    if previous is None:
+        return 'first report year'
+    if change is None:  # the measure is missing for this year or the previous one
+        return 'no change available since %d' % previous
+    return '%+.2f since %d' % (change, previous)
+
+def add_trend_lines(fig, series, name, color, dash=None):
+    for col, measure in enumerate(trend_measures, start=1):
+        changes = [trend_change(change, previous)
+                   for change, previous in zip(series[measure + '_yoy'], [None] + series['year'][:-1])]
+        fig.add_trace(go.Scatter(x=series['year'], y=series[measure], name=name, legendgroup=name,
+                                 showlegend=col == 1, mode='lines+markers', line={'color': color, 'dash': dash},
+                                 customdata=changes, hovertemplate='%{y:.2f} (%{customdata})'), 1, col)
+
+def trend_layout(fig):
+    fig.update_xaxes(dtick=1)
+    fig.update_layout(height = 300, margin = {'t':40, 'b':0, 'r':10, 'l':10}, hovermode='x unified',
+                      legend=dict(orientation="h", yanchor="bottom", y=-0.3))
+    fig.update_annotations(font_size=13)
+    return fig
 
-# ---------- For Tab 2 ----------
-# To filter for comapanies according to FI chosen in dropdown 1 [Company 1]
-@app.callback(
-    Output(component_id='company_dropdown_tab2', component_property='options'),
-    Input(component_id='type_of_fi_dropdown_tab2', component_property='value')
-)
-def update_dropdown_tab2_fi(type_of_fi):
-    sub_df = companylabels_file.loc[companylabels_file['type'] == type_of_fi]
-    options = [{'label': x[0], 'value': x[1]} for x in sub_df.values.tolist()]
-    return options
+# shown instead of the trend charts when the cube of the version has no rows for the companies
+def no_trend_figure(results, companies):
+    fig = go.Figure()
+    fig.add_annotation(text='No trend data for %s in version %s of the results' % (' and '.join(companies), results),
+                       x=0.5, y=0.5, xref='paper', yref='paper', showarrow=False, font_size=14)
+    fig.update_xaxes(visible=False)
+    fig.update_yaxes(visible=False)
+    fig.update_layout(height = 300, margin = {'t':40, 'b':0, 'r':10, 'l':10})
+    return fig
 
-# To filter for comapanies according to FI chosen in dropdown 1 [Company 2]   
-@app.callback(
-    Output(component_id='company_dropdown2_tab2', component_property='options'),
-    Input(component_id='company_dropdown_tab2', component_property='value'),
-    Input(component_id='type_of_fi_dropdown_tab2', component_property='value')
-)
-def update_dropdown_tab2_company(company1, type_of_fi):
-    sub_df = companylabels_file.loc[companylabels_file['type'] == type_of_fi]
-    options = [{'label': x[0], 'value': x[1]} for x in sub_df.values.tolist() if x[1] != company1]
-    return options
+@figure_cache.memoize
+@time_figure
+def trend_figure(results, type_of_fi, company):
+    if not results.has_trend(company):
+        return no_trend_figure(results, [company])
+    fig = make_subplots(rows=1, cols=3, subplot_titles=trend_titles)
+    add_trend_lines(fig, results.fi_trend(type_of_fi), 'Average' + ' (' + fi_dict[type_of_fi] + ')*',
+                    'rgb(76, 200, 163)', 'dash')
+    add_trend_lines(fig, results.company_trend(company), company, 'rgb(33, 113, 181)')
+    return trend_layout(fig)
 
-# To update comparison chart of percentage disclosure
-@app.callback(
-    Output(component_id='percentage_comparison', component_property='figure'),
-    Input(component_id='type_of_fi_dropdown_tab2', component_property='value'),
-    Input(component_id='company_dropdown_tab2', component_property='value'),
-    Input(component_id='company_dropdown2_tab2', component_property='value')
-)
-def update_graph_tab2_percentage(type_of_fi, company1, company2):
-    # Extract out dataframe for relevant FI, used for aggregation
-    sub_df = ratings_file.loc[ratings_file['type'] == type_of_fi]
-    percent_array = sub_df['percent'].values.tolist()
-    average = round(sum(percent_array) / len(percent_array), 2)
+# ---------- For Tab 2 ----------
+# Comparison of the year-over-year charts of two companies
+@figure_cache.memoize
+@time_figure
+def trend_comparison(results, type_of_fi, company1, company2):
+    missing = [company for company in [company1, company2] if not results.has_trend(company)]
+    if len(missing) == 2:
+        return no_trend_figure(results, missing)
+    fig = make_subplots(rows=1, cols=3, subplot_titles=trend_titles)
+    add_trend_lines(fig, results.fi_trend(type_of_fi), 'Average' + ' (' + fi_dict[type_of_fi] + ')*',
+                    'rgb(56, 178, 163)', 'dash')
+    for company, color in [(company1, 'rgb(33, 113, 181)'), (company2, 'rgb(239, 130, 50)')]:
+        if company not in missing:
+            add_trend_lines(fig, results.company_trend(company), company, color)
+    fig = trend_layout(fig)
+    if missing:
+        fig.update_layout(title={'text': 'No trend data for %s' % missing[0], 'font_size': 12, 'x': 0.5},
+                          margin={'t':70})
+    return fig
 
-    percent1 = round(ratings_file.set_index('name').percent.loc[company1], 2)
-    percent2 = round(ratings_file.set_index('name').percent.loc[company2], 2)
+# Comparison chart of percentage disclosure
+@figure_cache.memoize
+@time_figure
+def percentage_comparison(results, type_of_fi, company1, company2):
+    average = results.fi_averages[type_of_fi]['percent']
+    percent1 = results.company_percent(company1)
+    percent2 = results.company_percent(company2)
 
     labels = ["Decarbonization Related", "Decarbonization Unrelated"]
     fig = make_subplots(rows=1, cols=3, 
@@ -438,22 +722,14 @@ def update_graph_tab2_percentage(type_of_fi, company1, company2):
     fig.update_annotations(font_size=13, font_color='black')
     return fig
 
-# To update barplot for sentiment comparison
-@app.callback(
-    Output(component_id='sentiment_comparison', component_property='figure'),
-    Input(component_id='type_of_fi_dropdown_tab2', component_property='value'),
-    Input(component_id='company_dropdown_tab2', component_property='value'),
-    Input(component_id='company_dropdown2_tab2', component_property='value')
-)
-def update_graph_tab2_sentiment(type_of_fi, company1, company2):
-    # Extract out dataframe for relevant FI, used for aggregation
-    sub_df = sentiment_file.loc[sentiment_file['type'] == type_of_fi]
-    sentiment_array = sub_df['predicted_sentiment_tree'].values.tolist()
-    average = round(sum(sentiment_array) / len(sentiment_array), 2)
-
-    sentiment1 = round(sentiment_file.set_index('name').predicted_sentiment_tree.loc[company1], 2)
-    sentiment2 = round(sentiment_file.set_index('name').predicted_sentiment_tree.loc[company2], 2)
-    
+# Barplot for sentiment comparison
+@figure_cache.memoize
+@time_figure
+def sentiment_comparison(results, type_of_fi, company1, company2):
+    average = results.fi_averages[type_of_fi]['sentiment']
+    sentiment1 = results.company_sentiment(company1)
+    sentiment2 = results.company_sentiment(company2)
+
     fig = go.Figure(go.Bar(
             x=[average, sentiment2, sentiment1],
             y=['Average' + ' (' + fi_dict[type_of_fi] + ')*', company2, company1],
@@ -465,63 +741,185 @@ def update_graph_tab2_sentiment(type_of_fi, company1, company2):
     fig.update_layout(height = 350 , margin = {'t':20, 'b':0, 'r':10})
     return fig 
 
-# To update bigram chart 1
-@app.callback(
-    Output(component_id='bigram1', component_property='figure'),
-    Output(component_id='alert1', component_property='children'),
-    Input(component_id='company_dropdown_tab2', component_property='value')
-)
-def update_graph_tab2_bigram1(company1):
+# Callback ----------------------------------------------------------------------------
+# Company dropdowns are filtered in the browser from the company labels kept in the 'company_labels' store,
+# and each tab updates all of its charts in one request
+
+# a company missing from a result file leaves its chart as it is instead of failing the whole tab
+def render(figure, *args):
     try:
-        bigram_dict = bigram_file.set_index('name').bigramarray.loc[company1]
-        bigram_dict = ast.literal_eval(bigram_dict)
-        words = [w[0] for w in bigram_dict]
-        counts = [round(w[1],3) for w in bigram_dict]
-        alert_notification = dash.no_update
+        return figure(*args)
     except KeyError:
-        words = [0]
-        counts = ['No Decarbonization-Related Bigrams Available']
-        alert_notification = alert
+        return dash.no_update
 
-    fig = go.Figure(go.Bar(
-            x=counts,
-            y=words,
-            orientation='h',
-            marker_color=px.colors.sequential.Tealgrn,
-            text=counts,
-            textposition='inside'))
-    fig.update_layout(height = 450 , margin = {'t':60, 'b':0, 'r':10}, yaxis=dict(autorange="reversed"), 
-                    title_text=company1, title_font_size=13, title_x=0.5)
-    return fig, alert_notification
+# trend chart and the style of its panel, which is hidden while the version of the results has no rollup cube
+def render_trends(figure, results, *args):
+    if results.company_trends is None:
+        return dash.no_update, {'display': 'none'}
+    return render(figure, results, *args), {}
+
+# bigram chart and the alert shown for companies without decarbonization related bigrams
+def render_bigram(results, company, title=None):
+    fig, available = bigram_figure(results, company, title)
+    return fig, dash.no_update if available else alert
 
-# To update bigram chart 2
+# To filter for comapanies according to FI chosen 
+app.clientside_callback(
+    """
+    function(type_of_fi, labels) {
+        return labels.filter(x => x[2] === type_of_fi).map(x => ({'label': x[0], 'value': x[1]}));
+    }
+    """,
+    Output(component_id='company_dropdown_tab1', component_property='options'),
+    Input(component_id='type_of_fi_dropdown_tab1', component_property='value'),
+    State(component_id='company_labels', component_property='data')
+)
+
+# To update all charts of the company
 @app.callback(
+    Output(component_id='sentiment_gauge', component_property='figure'),
+    Output(component_id='percentage_barplot', component_property='figure'),
+    Output(component_id='initiative_barplot', component_property='figure'),
+    Output(component_id='initiative_table', component_property='figure'),
+    Output(component_id='bigram', component_property='figure'),
+    Output(component_id='alert', component_property='children'),
+    Output(component_id='trend_chart', component_property='figure'),
+    Output(component_id='trend_panel', component_property='style'),
+    Input(component_id='type_of_fi_dropdown_tab1', component_property='value'),
+    Input(component_id='company_dropdown_tab1', component_property='value')
+)
+@time_callback
+def update_tab1(type_of_fi, company):
+    results = current_results()
+    return (render(sentiment_gauge, results, type_of_fi, company),
+            render(percentage_barplot, results, type_of_fi, company),
+            render(initiative_barplot, results, type_of_fi, company),
+            render(initiative_table, results, company),
+            *render_bigram(results, company),
+            *render_trends(trend_figure, results, type_of_fi, company))
+
+# ---------- For Tab 2 ----------
+# To filter for comapanies according to FI chosen in dropdown 1 [Company 1]
+app.clientside_callback(
+    """
+    function(type_of_fi, labels) {
+        return labels.filter(x => x[2] === type_of_fi).map(x => ({'label': x[0], 'value': x[1]}));
+    }
+    """,
+    Output(component_id='company_dropdown_tab2', component_property='options'),
+    Input(component_id='type_of_fi_dropdown_tab2', component_property='value'),
+    State(component_id='company_labels', component_property='data')
+)
+
+# To filter for comapanies according to FI chosen in dropdown 1 [Company 2]
+app.clientside_callback(
+    """
+    function(company1, type_of_fi, labels) {
+        return labels.filter(x => x[2] === type_of_fi && x[1] !== company1).map(x => ({'label': x[0], 'value': x[1]}));
+    }
+    """,
+    Output(component_id='company_dropdown2_tab2', component_property='options'),
+    Input(component_id='company_dropdown_tab2', component_property='value'),
+    Input(component_id='type_of_fi_dropdown_tab2', component_property='value'),
+    State(component_id='company_labels', component_property='data')
+)
+
+# To update all comparison charts
+@app.callback(
+    Output(component_id='percentage_comparison', component_property='figure'),
+    Output(component_id='sentiment_comparison', component_property='figure'),
+    Output(component_id='bigram1', component_property='figure'),
+    Output(component_id='alert1', component_property='children'),
     Output(component_id='bigram2', component_property='figure'),
     Output(component_id='alert2', component_property='children'),
+    Output(component_id='trend_comparison', component_property='figure'),
+    Output(component_id='trend_comparison_panel', component_property='style'),
+    Input(component_id='type_of_fi_dropdown_tab2', component_property='value'),
+    Input(component_id='company_dropdown_tab2', component_property='value'),
     Input(component_id='company_dropdown2_tab2', component_property='value')
 )
-def update_graph_tab2_bigram2(company2):
-    try:
-        bigram_dict = bigram_file.set_index('name').bigramarray.loc[company2]
-        bigram_dict = ast.literal_eval(bigram_dict)
-        words = [w[0] for w in bigram_dict]
-        counts = [round(w[1],3) for w in bigram_dict]
-        alert_notification = dash.no_update
-    except KeyError:
-        words = [0]
-        counts = ['No Decarbonization-Related Bigrams Available']
-        alert_notification = alert
-    
-    fig = go.Figure(go.Bar(
-            x=counts,
-            y=words,
-            orientation='h',
-            marker_color=px.colors.sequential.Tealgrn,
-            text=counts,
-            textposition='inside'))
-    fig.update_layout(height = 450 , margin = {'t':60, 'b':0, 'r':10}, yaxis=dict(autorange="reversed"), 
-                    title_text=company2, title_font_size=13, title_x=0.5)
-    return fig, alert_notification
+@time_callback
+def update_tab2(type_of_fi, company1, company2):
+    results = current_results()
+    return (render(percentage_comparison, results, type_of_fi, company1, company2),
+            render(sentiment_comparison, results, type_of_fi, company1, company2),
+            *render_bigram(results, company1, company1),
+            *render_bigram(results, company2, company2),
+            *render_trends(trend_comparison, results, type_of_fi, company1, company2))
+
+# ---------- For Tab 3 ----------
+# To filter for companies according to the FIs chosen, every company when none is chosen
+app.clientside_callback(
+    """
+    function(types_of_fi, labels) {
+        return labels.filter(x => !types_of_fi || types_of_fi.length === 0 || types_of_fi.includes(x[2]))
+                     .map(x => ({'label': x[0], 'value': x[1]}));
+    }
+    """,
+    Output(component_id='company_dropdown_tab3', component_property='options'),
+    Input(component_id='type_of_fi_dropdown_tab3', component_property='value'),
+    State(component_id='company_labels', component_property='data')
+)
+
+# Year options from the years of the index kept in the 'sentence_years' store, which the search below refreshes
+# once the index is rebuilt
+app.clientside_callback(
+    """
+    function(years) {
+        return (years || []).map(y => ({'label': String(y), 'value': y}));
+    }
+    """,
+    Output(component_id='year_dropdown_tab3', component_property='options'),
+    Input(component_id='sentence_years', component_property='data')
+)
+
+# To search the sentences most similar to the one entered, within the FIs, companies and years chosen
+@app.callback(
+    Output(component_id='similar_sentences', component_property='children'),
+    Output(component_id='alert_similar', component_property='children'),
+    Output(component_id='sentence_years', component_property='data'),
+    Input(component_id='sentence_input', component_property='value'),
+    Input(component_id='k_dropdown', component_property='value'),
+    Input(component_id='type_of_fi_dropdown_tab3', component_property='value'),
+    Input(component_id='company_dropdown_tab3', component_property='value'),
+    Input(component_id='year_dropdown_tab3', component_property='value'),
+    State(component_id='sentence_years', component_property='data')
+)
+@time_callback
+def update_tab3(sentence, k, types_of_fi, companies, years, shown_years):
+    if not sentence:
+        return [], [], dash.no_update
+    index = current_sentence_index()
+    # years of an index rebuilt since the page was loaded
+    new_years = sentence_years()
+    new_years = dash.no_update if new_years == shown_years else new_years
+    if index is None:
+        return [], alert_no_index, new_years
+    similar = index.search(sentence, k=k, companies=companies, types=types_of_fi, years=years)
+    if similar.empty:
+        return [], alert_no_match, new_years
+    similar['type'] = similar['type'].map(fi_dict)
+    similar['similarity'] = similar['similarity'].round(3)
+    similar.columns = ['Company', 'Type', 'Year', 'Sentence', 'Similarity']
+    return dbc.Table.from_dataframe(similar, striped=True, hover=True, size='sm'), [], new_years
+
+# Warm Up ------------------------------------------------------------------------------
+# Pre-render the figures of every single company, so only company pairs in tab 2 are built on request
+def warm_up_figure_cache(results):
+    for type_of_fi in fi_dict:
+        for option in company_options.get(type_of_fi, []):
+            company = option['value']
+            render(sentiment_gauge, results, type_of_fi, company)
+            render(percentage_barplot, results, type_of_fi, company)
+            render(initiative_barplot, results, type_of_fi, company)
+            render(initiative_table, results, company)
+            render(bigram_figure, results, company)
+            render(bigram_figure, results, company, company)
+            render_trends(trend_figure, results, type_of_fi, company)
+
+# eg. WARM_UP_FIGURE_CACHE=1 gunicorn dashboard:server
+if os.environ.get('WARM_UP_FIGURE_CACHE'):
+    warm_up_figure_cache(results)
 
 # -------------------------------------------------------------------------------------
 if __name__ == '__main__':
@@ -0,0 +1,59 @@
+import os
+import time
+from functools import wraps
+
+from flask import Response
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client import multiprocess
+
+# Timings of the dashboard callbacks and figures in Prometheus format, served on /metrics.
+# With gunicorn, set PROMETHEUS_MULTIPROC_DIR to an empty folder so /metrics adds up the metrics of every worker
+
+# Upper bounds of the histogram buckets in seconds, from figure cache hits to figures built from scratch
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+CALLBACK_SECONDS = Histogram('dashboard_callback_duration_seconds', 'Time taken by each dashboard callback',
+                             ['callback'], buckets=BUCKETS)
+CALLBACK_ERRORS = Counter('dashboard_callback_errors_total', 'Dashboard callbacks that raised an exception',
+                          ['callback'])
+FIGURE_SECONDS = Histogram('dashboard_figure_build_seconds', 'Time taken to build a figure missing from the cache',
+                           ['figure'], buckets=BUCKETS)
+
+
+def _timed(histogram, errors=None):
+    def decorator(func):
+        observe = histogram.labels(func.__name__).observe  # created up front, so /metrics lists it before any call
+        error = errors.labels(func.__name__) if errors is not None else None
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                if error is not None:
+                    error.inc()
+                raise
+            finally:
+                observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+# decorator timing a dash callback, goes between @app.callback and the function
+time_callback = _timed(CALLBACK_SECONDS, CALLBACK_ERRORS)
+
+# decorator timing a figure function, goes below @figure_cache.memoize so only cache misses are timed
+time_figure = _timed(FIGURE_SECONDS)
+
+
+# function to add the /metrics route to the flask server of the dashboard
+def add_metrics_route(server, path='/metrics'):
+    @server.route(path)
+    def metrics():
+        registry = REGISTRY
+        if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        return Response(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+    return metrics
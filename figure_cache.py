@@ -0,0 +1,139 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+import plotly
+
+FIGURE_CACHE_DIR = 'cache/figures'
+
+_MISSING = object()
+
+
+# Figures returned by the dashboard callbacks, keyed on the function, its inputs and the version of the results.
+# Entries are JSON files in one folder so every gunicorn worker shares them, with a small LRU of parsed figures
+# kept in each worker in front of the disk. Reading a file marks it as recently used, the least recently used
+# files are evicted past max_entries. Entries built more than ttl seconds ago are rebuilt when read and removed
+# by prune. The LRU is shared by the threads of a worker and guarded by a lock.
+class FigureCache:
+
+    def __init__(self, directory=FIGURE_CACHE_DIR, version='', max_entries=5000, ttl=24 * 60 * 60,
+                 max_memory=256, prune_every=100):
+        self.directory = directory
+        self.version = version
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_memory = max_memory
+        self.prune_every = prune_every
+        self._memory = OrderedDict()
+        self._writes = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _key(self, name, args, kwargs):
+        payload = json.dumps([self.version, name, args, sorted(kwargs.items())], default=str)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.json')
+
+    def _expired(self, timestamp, now):
+        return self.ttl is not None and now - timestamp > self.ttl
+
+    def _remember(self, key, timestamp, value):
+        with self._lock:
+            self._memory[key] = (timestamp, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory:
+                self._memory.popitem(last=False)
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                timestamp, value = entry
+                if not self._expired(timestamp, now):
+                    self._memory.move_to_end(key)
+                    return value
+                del self._memory[key]
+
+        path = self._path(key)
+        try:
+            with open(path, encoding='utf-8') as f:
+                timestamp, value = json.load(f)
+            if self._expired(timestamp, now):
+                os.remove(path)
+                return _MISSING
+            os.utime(path)  # mtime orders entries for eviction
+        except (OSError, ValueError):  # missing or evicted by another worker
+            return _MISSING
+        self._remember(key, timestamp, value)
+        return value
+
+    def set(self, key, value):
+        # stored as plain JSON, what dash sends to the browser anyway, next to the time it was built
+        timestamp = time.time()
+        text = json.dumps([timestamp, value], cls=plotly.utils.PlotlyJSONEncoder)
+        value = json.loads(text)[1]
+        path = self._path(key)
+        # unique per thread as well, threaded servers build the same figure for concurrent requests
+        tmp_path = '%s.%d.%d.tmp' % (path, os.getpid(), threading.get_ident())
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+        self._remember(key, timestamp, value)
+
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % self.prune_every == 0
+        if prune:
+            self.prune()
+        return value
+
+    # time an entry was built, the number the JSON file starts with
+    @staticmethod
+    def _built(path):
+        with open(path, encoding='utf-8') as f:
+            return float(f.read(64).lstrip('[').split(',', 1)[0])
+
+    # function to remove entries built more than ttl seconds ago, then the least recently used ones above max_entries
+    def prune(self):
+        now = time.time()
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith('.json'):
+                continue
+            try:
+                stat = entry.stat()
+                built = self._built(entry.path)
+            except (OSError, ValueError):  # removed by another worker, or still being replaced
+                continue
+            if self._expired(built, now):
+                self._remove(entry.path)
+            else:
+                entries.append((stat.st_mtime, entry.path))
+        entries.sort()
+        for _, path in entries[:max(0, len(entries) - self.max_entries)]:
+            self._remove(path)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:  # already removed by another worker
+            pass
+
+    # decorator caching the return value of a figure building function, exceptions are not cached
+    def memoize(self, func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            key = self._key(func.__name__, args, kwargs)
+            value = self.get(key)
+            if value is _MISSING:
+                value = self.set(key, func(*args, **kwargs))
+            return value
+        return wrapper
@@ -0,0 +1,103 @@
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sps
+from sklearn.feature_extraction import text
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+BIGRAM_FILE = 'results/bigram_df.csv'
+
+# TF-IDF vocabulary and idf of the last full run, reused to score the sentences of new reports
+BIGRAM_VECTORIZER_FILE = 'model/bigram_tfidf.pkl'
+
+
+def create_stopwords_for_bigram():
+    # context specific keywords not to include in topic modelling
+    context_stopwords = ['report', 'annualreport', 'pdf', 'firm', 'company', 'uobam', 'page', 'ceo',
+                      'content', 'index', 'guide', 'data', 'chairman', 'executive', 'chief', 'fiscal',
+                      'stakeholders', 'acn', 'vs', 'yoy', 'brigade', 'station', 'site', 'table',
+                      'journey', 'achieve', 'endure', 'reporting', 'period', 'head', 'way', 'gri',
+                      'holding', 'http', 'https', 'www', 'hi', 'audit', 'fy']
+
+    country_stopwords = ['malaysia', 'hong', 'kong', 'china', 'country', 'region', 'japan', 'japanese',
+                      'tokyo', 'south', 'africa', 'france', 'switzerland', 'germany', 'rio',
+                      'kuala', 'lumpur', 'hk', 'hkex', 'australia', 'eu', 'chinese', 'mainland',
+                      'citi', 'pacific', 'mitsubishi', 'cid', 'cppib', 'dai', 'chi']
+
+    currency_stopwords = ['eur', 'million', 'es', 'dd', 'source', 'rmb', 'krw', 'trillion', 'billion', 'euro']
+
+    date_stopwords = ['january', 'february', 'march', 'april', 'may', 'june', 'july', 'august',
+                    'september', 'october', 'november', 'december', 'year', 'month', 'annual']
+
+    stopwords = context_stopwords + country_stopwords + date_stopwords + currency_stopwords
+
+    # add company names as stop words
+    complabels = pd.read_csv('data/companylabels.csv', usecols=['fullname', 'shortform'])
+    ls_comp = complabels['fullname'].unique().tolist() + complabels['shortform'].unique().tolist()
+    for name in ls_comp:
+        for n in name.split(' '):
+            stopwords.append(n.lower())
+
+    # our list contains all english stop words + companies names + specific keywords
+
+    stop_words = text.ENGLISH_STOP_WORDS.union(stopwords)
+    return stop_words
+
+
+# function to get the indices of the k largest values, ties broken by the lower index (alphabetical bigram)
+def _top_k(values, k):
+    if len(values) > k:
+        threshold = values[np.argpartition(values, -k)[-k]]
+        candidates = np.flatnonzero(values >= threshold)
+    else:
+        candidates = np.arange(len(values))
+    order = np.lexsort((candidates, -values[candidates]))
+    return candidates[order[:k]]
+
+
+# function to fit the TF-IDF vocabulary of bigrams over the lemmatized sentences
+def fit_bigram_vectorizer(lemmas):
+    bigram_tf_idf_vectorizer = TfidfVectorizer(stop_words=list(create_stopwords_for_bigram()), ngram_range=(2,2), min_df=1, use_idf=True)
+    return bigram_tf_idf_vectorizer.fit(lemmas)
+
+
+def save_bigram_vectorizer(vectorizer, path=BIGRAM_VECTORIZER_FILE):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        pickle.dump(vectorizer, f)
+    return path
+
+
+def load_bigram_vectorizer(path=BIGRAM_VECTORIZER_FILE):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+# function to find the top k bigrams of each company
+# the TF-IDF vocabulary is fitted once over all sentences (or a fitted vectorizer is reused), then the sentence
+# rows of each company are summed with one sparse indicator matrix product (companies x sentences) @ (sentences x bigrams)
+def top_bigrams(df, k=10, group='name', vectorizer=None):
+    if vectorizer is None:
+        vectorizer = fit_bigram_vectorizer(df.lemma)
+    bigram_tf_idf = vectorizer.transform(df.lemma)
+    words = vectorizer.get_feature_names_out()
+
+    codes, companies = pd.factorize(df[group])
+    indicator = sps.csr_matrix((np.ones(len(codes)), (codes, np.arange(len(codes)))),
+                               shape=(len(companies), len(codes)))
+    total_counts = (indicator @ bigram_tf_idf).tocsr()
+    total_counts.sort_indices()
+
+    data = []
+    for c, company in enumerate(companies):
+        start, end = total_counts.indptr[c], total_counts.indptr[c + 1]
+        if start == end:  # no decarbonization related bigrams, the dashboard shows an alert for missing companies
+            continue
+        scores = total_counts.data[start:end]
+        indices = total_counts.indices[start:end]
+        data.append([company, [(words[indices[i]], float(scores[i])) for i in _top_k(scores, k)]])
+
+    bigram_df = pd.DataFrame(data, columns = ['name', 'bigramarray'])
+    return bigram_df
@@ -0,0 +1,58 @@
+import os
+
+import gensim
+import pandas as pd
+from gensim.utils import simple_preprocess
+from nltk.corpus import stopwords
+
+# Phrase model of the LDA corpus, saved so sentences of new reports are joined into the same bigrams
+BIGRAM_MODEL_FILE = 'model/ldamallet/bigram.phraser'
+
+
+# function for gensim preprocessing
+def sent_to_words(sentences):
+    for sentence in sentences:
+        yield(simple_preprocess(str(sentence), deacc=True))
+
+
+# function for creating stopwords (english stopwords, context specific words, company names)
+def create_stopwords():
+    stop_words = stopwords.words('english')
+
+    complabels = pd.read_csv('data/companylabels.csv', usecols=['fullname', 'shortform'])
+    ls_comp = complabels['fullname'].unique().tolist() + complabels['shortform'].unique().tolist()
+    for name in ls_comp:
+        for n in name.split(' '):
+            stop_words.append(n.lower())
+
+    stop_words.extend(['accounting', 'active', 'income', 'adventure', 'allocation', 'shares', 'amortization', 'amplitude', 'annuity', 'appreciation', 'arbitrage', 'ask', 'asset', 'asset approach', 'aval'])
+    stop_words.extend(['plc', 'group', 'target', 'track', 'capital', 'holding', 'report', 'annualreport', 'esg', 'bank', 'report', 'annualreport', 'long', 'make', 'fy'])
+    return stop_words
+
+
+# function for removing stopwords
+def remove_stopwords(texts, stop_words):
+    stop_words = set(stop_words)
+    return [[word for word in simple_preprocess(str(doc)) if word not in stop_words] for doc in texts]
+
+
+# function for creating bigram models
+def create_bigram_mod(data_words):
+    bigram = gensim.models.Phrases(data_words, min_count=5, threshold=100) # higher threshold fewer phrases.
+    bigram_mod = gensim.models.phrases.Phraser(bigram)
+    return bigram_mod
+
+
+# function for making bigrams
+def make_bigrams(texts, bigram_mod):
+    return [bigram_mod[doc] for doc in texts]
+
+
+def save_bigram_mod(bigram_mod, path=BIGRAM_MODEL_FILE):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    bigram_mod.save(path)
+    return path
+
+
+def load_bigram_mod(path=BIGRAM_MODEL_FILE):
+    return gensim.models.phrases.Phraser.load(path)
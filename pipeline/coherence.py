@@ -0,0 +1,116 @@
+import hashlib
+import os
+
+import numpy as np
+import scipy.sparse as sps
+from gensim import matutils
+
+# Saved next to id2word.dict so every candidate model is scored against the same corpus statistics
+INDEX_FILE = 'model/ldamallet/cooccurrence.npz'
+
+# Sliding window size and epsilon used by gensim's c_v coherence
+WINDOW_SIZE = 110
+EPSILON = 1e-12
+
+
+# function to fingerprint the lemmatized texts together with the dictionary they are mapped to
+def corpus_fingerprint(texts, dictionary, window_size=WINDOW_SIZE):
+    sha = hashlib.sha1(str(window_size).encode('utf-8'))
+    sha.update(' '.join(token for token, _ in sorted(dictionary.token2id.items(), key=lambda x: x[1])).encode('utf-8'))
+    for text in texts:
+        sha.update(b'\n')
+        sha.update(' '.join(text).encode('utf-8'))
+    return sha.hexdigest()
+
+
+# Sparse window x word matrix with a 1 wherever a word occurs in a sliding window of the corpus.
+# Occurrence counts are its column sums and co-occurrence counts come from X.T X, so c_v coherence
+# of any set of topics is computed without another pass over the texts (same windows as gensim's
+# p_boolean_sliding_window: a text shorter than the window is one window, longer texts slide by one)
+class CooccurrenceIndex:
+
+    def __init__(self, windows, window_size, fingerprint):
+        self.windows = windows.tocsc()
+        self.num_docs = windows.shape[0]
+        self.window_size = window_size
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def build(cls, texts, dictionary, window_size=WINDOW_SIZE, fingerprint=None):
+        token2id = dictionary.token2id
+        indptr = [0]
+        indices = []
+        for text in texts:
+            ids = [token2id.get(w, -1) for w in text]
+            window = set(ids[:window_size])
+            for start in range(max(1, len(ids) - window_size + 1)):
+                # like gensim, sliding drops the token leaving the window even if it occurs again inside it
+                if start:
+                    window.discard(ids[start - 1])
+                    window.add(ids[start + window_size - 1])
+                indices.extend(i for i in window if i >= 0)
+                indptr.append(len(indices))
+        data = np.ones(len(indices), dtype=np.uint8)
+        windows = sps.csr_matrix((data, np.array(indices, dtype=np.int32), np.array(indptr, dtype=np.int64)),
+                                 shape=(len(indptr) - 1, len(dictionary)))
+        if fingerprint is None:
+            fingerprint = corpus_fingerprint(texts, dictionary, window_size)
+        return cls(windows, window_size, fingerprint)
+
+    def save(self, path=INDEX_FILE):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp.npz'
+        np.savez_compressed(tmp_path, data=self.windows.data, indices=self.windows.indices,
+                            indptr=self.windows.indptr, shape=np.array(self.windows.shape),
+                            window_size=self.window_size, fingerprint=self.fingerprint)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=INDEX_FILE):
+        with np.load(path) as f:
+            windows = sps.csc_matrix((f['data'], f['indices'], f['indptr']), shape=tuple(f['shape']))
+            return cls(windows, int(f['window_size']), str(f['fingerprint']))
+
+    # function to get occurrence counts and the co-occurrence matrix of the given word ids
+    def counts(self, word_ids):
+        sub = self.windows[:, word_ids].astype(np.float64)
+        co_occurrences = (sub.T @ sub).toarray()
+        return np.diag(co_occurrences).copy(), co_occurrences
+
+    # function to compute the c_v coherence of each topic, topics are lists of word ids
+    def topic_coherences(self, topics):
+        relevant = sorted({w for topic in topics for w in topic})
+        position = {w: i for i, w in enumerate(relevant)}
+        occurrences, co_occurrences = self.counts(relevant)
+
+        # normalized pointwise mutual information of every pair of relevant words
+        n = float(self.num_docs)
+        co_prob = co_occurrences / n + EPSILON
+        prob = occurrences / n
+        npmi = np.log(co_prob / np.outer(prob, prob)) / -np.log(co_prob)
+
+        coherences = []
+        for topic in topics:
+            idx = [position[w] for w in topic]
+            context = npmi[np.ix_(idx, idx)]  # context vector of each topic word
+            topic_context = context.sum(axis=0)  # context vector of the whole topic
+            sims = context @ topic_context / (np.linalg.norm(context, axis=1) * np.linalg.norm(topic_context))
+            coherences.append(sims.mean())
+        return coherences
+
+    # function to compute the c_v coherence of a trained LDA model from its top topn words per topic
+    def coherence(self, model, topn=20):
+        topics = [matutils.argsort(topic, topn=topn, reverse=True) for topic in model.get_topics()]
+        return float(np.mean(self.topic_coherences(topics)))
+
+
+# function to load the saved index, it is rebuilt (one pass over the texts) when the texts or dictionary changed
+def load_or_build_index(texts, dictionary, path=INDEX_FILE, window_size=WINDOW_SIZE):
+    fingerprint = corpus_fingerprint(texts, dictionary, window_size)
+    if os.path.exists(path):
+        index = CooccurrenceIndex.load(path)
+        if index.fingerprint == fingerprint:
+            return index
+    index = CooccurrenceIndex.build(texts, dictionary, window_size, fingerprint)
+    index.save(path)
+    return index
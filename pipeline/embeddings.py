@@ -0,0 +1,196 @@
+import hashlib
+import json
+import os
+import re
+
+import gensim
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+import seaborn as sns
+from gensim.models import Word2Vec
+from gensim.models.phrases import Phraser, Phrases
+from nltk.corpus import stopwords
+from sklearn.decomposition import PCA
+from sklearn.manifold import TSNE
+
+# Word2Vec model of each company, saved as its words and unit length vectors, eg. model/word2vec/OCBC.npz
+EMBEDDING_DIR = 'model/word2vec'
+
+VECTOR_SIZE = 55
+EPOCHS = 40
+W2V_PARAMS = {'min_count': 1, 'window': 3, 'sample': 6e-5, 'alpha': 0.05, 'min_alpha': 0.0007, 'negative': 20}
+
+# gensim 4 renamed size to vector_size and index2word to index_to_key, environment.yml pins gensim 3.6
+_GENSIM_4 = int(gensim.__version__.split('.')[0]) >= 4
+
+# Embeddings loaded in this process, company: (fingerprint, embeddings)
+_loaded = {}
+
+
+# function to split the sentences of a company into words without english stopwords, then join its bigrams
+def company_sentences(df, company_name):
+    stop_words = set(stopwords.words('english'))
+    sent = [[word for word in row.split() if word not in stop_words]
+            for row in df['sentence'].loc[df['name'] == company_name]]
+    bigram = Phraser(Phrases(sent, min_count=10))
+    return [bigram[s] for s in sent]
+
+
+def train_word2vec(sentences):
+    size = {'vector_size' if _GENSIM_4 else 'size': VECTOR_SIZE}
+    w2v_model = Word2Vec(**size, **W2V_PARAMS)
+    w2v_model.build_vocab(sentences)
+    w2v_model.train(sentences, total_examples=w2v_model.corpus_count, epochs=EPOCHS, report_delay=1)
+    return w2v_model
+
+
+# Words of one company and their vectors scaled to unit length, so cosine similarities are dot products
+class Embeddings:
+
+    def __init__(self, words, vectors):
+        self.words = list(words)
+        self.vectors = vectors
+        self.index = {word: i for i, word in enumerate(self.words)}
+
+    @classmethod
+    def from_model(cls, w2v_model):
+        words = w2v_model.wv.index_to_key if _GENSIM_4 else w2v_model.wv.index2word
+        vectors = np.asarray(w2v_model.wv.vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return cls(words, vectors / np.maximum(norms, 1e-12))
+
+    # function to get the topn most similar words to each term (least similar with negative=True),
+    # one matrix product for all terms, terms missing from the vocabulary get an empty list
+    def most_similar(self, terms, topn=10, negative=False):
+        known = [term for term in terms if term in self.index]
+        results = {term: [] for term in terms}
+        topn = min(topn, len(self.words) - 1)
+        if not known or topn < 1:
+            return results
+        rows = [self.index[term] for term in known]
+        sign = -1 if negative else 1
+        similarities = sign * (self.vectors[rows] @ self.vectors.T)
+        similarities[np.arange(len(rows)), rows] = -np.inf  # a term is not similar to itself
+        top = np.argpartition(-similarities, topn - 1, axis=1)[:, :topn]
+        for i, term in enumerate(known):
+            order = top[i][np.argsort(-similarities[i, top[i]])]
+            results[term] = [(self.words[j], float(sign * similarities[i, j])) for j in order]
+        return results
+
+    def save(self, path, fingerprint):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, words=np.array(self.words, dtype=str), vectors=self.vectors,
+                 fingerprint=np.array(fingerprint))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['words'].tolist(), data['vectors']), str(data['fingerprint'])
+
+
+# function to fingerprint the sentences of a company and the training parameters, a model is retrained when they change
+def _fingerprint(df, company_name):
+    sha = hashlib.sha1(json.dumps([VECTOR_SIZE, EPOCHS, W2V_PARAMS], sort_keys=True).encode('utf-8'))
+    for sentence in df['sentence'].loc[df['name'] == company_name]:
+        sha.update(str(sentence).encode('utf-8'))
+        sha.update(b'\0')
+    return sha.hexdigest()
+
+
+def _path(company_name, directory):
+    return os.path.join(directory, re.sub(r'[^\w-]+', '_', company_name) + '.npz')
+
+
+# function to get the embeddings of a company, trained only the first time (or after its sentences change),
+# then read from model/word2vec and kept in memory
+def load_embeddings(df, company_name, directory=EMBEDDING_DIR):
+    fingerprint = _fingerprint(df, company_name)
+    key = (directory, company_name)
+    if key in _loaded and _loaded[key][0] == fingerprint:
+        return _loaded[key][1]
+
+    path = _path(company_name, directory)
+    embeddings = None
+    if os.path.exists(path):
+        embeddings, saved_fingerprint = Embeddings.load(path)
+        if saved_fingerprint != fingerprint:
+            embeddings = None
+    if embeddings is None:
+        embeddings = Embeddings.from_model(train_word2vec(company_sentences(df, company_name)))
+        embeddings.save(path, fingerprint)
+    _loaded[key] = (fingerprint, embeddings)
+    return embeddings
+
+
+# function to answer many similarity lookups at once, queries is a list of (company, term)
+# returns {(company, term): [(word, similarity), ...]}, one matrix product per company
+def most_similar_batch(df, queries, topn=50, directory=EMBEDDING_DIR):
+    by_company = {}
+    for company_name, term in queries:
+        by_company.setdefault(company_name, []).append(term)
+    results = {}
+    for company_name, terms in by_company.items():
+        similar = load_embeddings(df, company_name, directory).most_similar(terms, topn=topn)
+        results.update({(company_name, term): similar[term] for term in terms})
+    return results
+
+
+# function to find the 50 words most similar to a term in the reports of a company
+def word2vec(df, company_name, *args):
+    for word in args:
+        return load_embeddings(df, company_name).most_similar([word], topn=50)[word]
+
+
+# function to plot a word, its 10 most similar words (blue) and list_names (green) with TSNE
+def tsnescatterplot(embeddings, word, list_names):
+    close_words = [w for w, _ in embeddings.most_similar([word])[word]]
+    word_labels = [word] + close_words + list(list_names)
+    color_list = ['red'] + ['blue'] * len(close_words) + ['green'] * len(list_names)
+    arrays = embeddings.vectors[[embeddings.index[w] for w in word_labels]]
+
+    reduc = PCA(n_components=min(21, *arrays.shape)).fit_transform(arrays)
+
+    np.set_printoptions(suppress=True)
+
+    Y = TSNE(n_components=2, random_state=0, perplexity=min(15, len(word_labels) - 1)).fit_transform(reduc)
+
+    # Sets everything up to plot
+    df = pd.DataFrame({'x': [x for x in Y[:, 0]],
+                       'y': [y for y in Y[:, 1]],
+                       'words': word_labels,
+                       'color': color_list})
+    fig, _ = plt.subplots()
+    fig.set_size_inches(9, 9)
+
+    # Basic plot
+    p1 = sns.regplot(data=df,
+                     x="x",
+                     y="y",
+                     fit_reg=False,
+                     marker="o",
+                     scatter_kws={'s': 40,
+                                  'facecolors': df['color']
+                                  }
+                     )
+    for line in range(0, df.shape[0]):
+        p1.text(df["x"][line],
+                df['y'][line],
+                '  ' + df["words"][line].title(),
+                horizontalalignment='left',
+                verticalalignment='bottom', size='medium',
+                color=df['color'][line],
+                weight='normal'
+                ).set_size(15)
+
+    plt.xlim(Y[:, 0].min()-50, Y[:, 0].max()+50)
+    plt.ylim(Y[:, 1].min()-50, Y[:, 1].max()+50)
+    plt.title('t-SNE visualization for {}'.format(word.title()))
+
+
+# function to plot a word of a company against the 10 words least similar to 'financial'
+def word2vec_tsne(df, company_name, args):
+    embeddings = load_embeddings(df, company_name)
+    tsnescatterplot(embeddings, args, [w for w, _ in embeddings.most_similar(['financial'], negative=True)['financial']])
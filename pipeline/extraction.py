@@ -0,0 +1,145 @@
+import gzip
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz
+import pandas as pd
+
+# Folder containing one sub-folder of reports per type of FI
+DATA_DIR = 'data/type'
+
+# Extracted pages are cached by the sha256 of each pdf, so a renamed or moved report is never re-read
+CACHE_DIR = 'cache/pages'
+
+# Reports that PyMuPDF fails to open are recorded here instead of being skipped by hand
+QUARANTINE_FILE = 'cache/quarantine.json'
+
+# To map type of FI to its folder in data/type
+fi_folders = {'ab': 'asian_banks', 'am': 'asset_managers', 'ins': 'insurance', 'pf': 'pension_funds'}
+
+
+# function to hash the content of a pdf (cache key)
+def hash_pdf(file_path, chunk_size=1 << 20):
+    sha = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+# function to get company name and year from a report filename eg. OCBC-2018.pdf, Ashmore-2-2019.pdf
+def parse_filename(filename):
+    companyname = filename.split('-', 1)[0]
+    year = int(filename.split('-')[-1][:-4])
+    return companyname, year
+
+
+# function to extract the text of every page in a pdf, runs inside a worker process
+def extract_pages(file_path):
+    with fitz.open(file_path) as doc:
+        return [page.get_text() for page in doc]
+
+
+def _cache_path(digest, cache_dir):
+    return os.path.join(cache_dir, digest[:2], digest + '.json.gz')
+
+
+def load_pages(digest, cache_dir=CACHE_DIR):
+    with gzip.open(_cache_path(digest, cache_dir), 'rt', encoding='utf-8') as f:
+        return json.load(f)
+
+
+# write to a temporary file first so an interrupted run never leaves a half-written cache entry
+def _save_pages(digest, pages, cache_dir):
+    path = _cache_path(digest, cache_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+        json.dump(pages, f)
+    os.replace(tmp_path, path)
+
+
+def load_quarantine(quarantine_file=QUARANTINE_FILE):
+    if not os.path.exists(quarantine_file):
+        return {}
+    with open(quarantine_file) as f:
+        return json.load(f)
+
+
+def _save_quarantine(quarantine, quarantine_file):
+    os.makedirs(os.path.dirname(quarantine_file), exist_ok=True)
+    tmp_path = quarantine_file + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(quarantine, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, quarantine_file)
+
+
+# function to list the reports of each FI as (type, path, companyname, year)
+# files whose name has no year are returned separately so they can be quarantined
+def list_reports(fis, data_dir=DATA_DIR):
+    reports = []
+    bad_names = []
+    for fi in fis:
+        directory = os.path.join(data_dir, fi_folders[fi])
+        for filename in sorted(os.listdir(directory)):
+            if not filename.endswith('.pdf'):  # to filter out non pdf files eg. README.md, .DS_Store
+                continue
+            file_path = os.path.join(directory, filename)
+            try:
+                companyname, year = parse_filename(filename)
+            except ValueError:
+                bad_names.append(file_path)
+                continue
+            reports.append((fi, file_path, companyname, year))
+    return reports, bad_names
+
+
+# function to extract all reports of the given FI types, only pdfs that are new or changed are opened
+# returns one row per report (name, sentence, year, type, sha256), where sentence holds the full text
+def extract_reports(fis=('ab', 'am', 'ins', 'pf'), max_workers=None, data_dir=DATA_DIR,
+                    cache_dir=CACHE_DIR, quarantine_file=QUARANTINE_FILE):
+    reports, bad_names = list_reports(fis, data_dir)
+    digests = [hash_pdf(file_path) for _, file_path, _, _ in reports]
+
+    # quarantined pdfs are only retried once their content changes
+    errors = {entry['sha256']: entry['error'] for entry in load_quarantine(quarantine_file).values()}
+    pending = {}
+    for (_, file_path, _, _), digest in zip(reports, digests):
+        if digest not in errors and not os.path.exists(_cache_path(digest, cache_dir)):
+            pending[digest] = file_path
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {digest: executor.submit(extract_pages, file_path) for digest, file_path in pending.items()}
+            for digest, future in futures.items():
+                try:
+                    _save_pages(digest, future.result(), cache_dir)
+                except Exception as e:
+                    errors[digest] = repr(e)
+
+    # rebuilt on every run, so deleted or fixed reports drop out of the quarantine
+    quarantine = {file_path: {'sha256': None, 'error': 'filename does not end with -<year>.pdf'}
+                  for file_path in bad_names}
+    for (_, file_path, _, _), digest in zip(reports, digests):
+        if digest in errors:
+            quarantine[file_path] = {'sha256': digest, 'error': errors[digest]}
+    _save_quarantine(quarantine, quarantine_file)
+    for file_path, entry in sorted(quarantine.items()):
+        print("Quarantined: %s : %s" % (file_path, entry['error']))
+
+    rows = []
+    for (fi, _, companyname, year), digest in zip(reports, digests):
+        if digest in errors:
+            continue
+        text = ''.join(load_pages(digest, cache_dir))
+        rows.append({'name': companyname, 'sentence': text, 'year': year, 'type': fi, 'sha256': digest})
+    return pd.DataFrame(rows, columns=['name', 'sentence', 'year', 'type', 'sha256'])
+
+
+# function to read all reports of one type of FI, eg. read_pdf('asian_banks')
+def read_pdf(fi, max_workers=None):
+    fi_type = {folder: t for t, folder in fi_folders.items()}[fi]
+    data = extract_reports([fi_type], max_workers=max_workers)
+    return data[['name', 'sentence', 'year']]
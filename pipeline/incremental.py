@@ -0,0 +1,144 @@
+import os
+
+import numpy as np
+import pandas as pd
+from gensim import corpora
+
+from pipeline.bigrams import BIGRAM_VECTORIZER_FILE, load_bigram_vectorizer, top_bigrams
+from pipeline.cleaning import BIGRAM_MODEL_FILE, create_stopwords, load_bigram_mod
+from pipeline.extraction import extract_reports
+from pipeline.initiatives import extract_initiatives
+from pipeline.keywords import build_matcher
+from pipeline.lemmas import lemmatization, lemmatize, load_nlp
+from pipeline.results import (RESULTS_DIR, current_version, load_reports, load_results, load_trends, publish_results,
+                              write_result_csvs)
+from pipeline.sentences import COLUMNS, iter_sentences
+from pipeline.sentiment import (SENTIMENT_MODEL_DIR, generate_sentiment_score, predict_sentiment_by_type,
+                                sentiment_by_company)
+from pipeline.topics import (ID2WORD_FILE, MODEL_DIR, decarbonization_percent, document_topics, dominant_topics,
+                             latest_optimal_model, load_optimal_model, topic_labels)
+from pipeline.trends import company_trends, merge_trends
+
+# Incremental update: only companies with new, changed or removed reports are scored again, with the LDA model,
+# phrase model, bigram TF-IDF and sentiment models saved by the last full run, and merged into the published
+# results. The FI averages shown by the dashboard are computed from the merged results. Retraining the models
+# (new topics, vocabulary or idf) still requires the full run of the notebook or python -m pipeline.run.
+
+
+# function to find the companies whose reports differ from the ones the published results were computed from
+def changed_companies(reports, published_reports):
+    def shas(df):
+        return {key: sorted(group['sha256']) for key, group in df.groupby(['type', 'name'])}
+    current, published = shas(reports), shas(published_reports)
+    changed = set()
+    for key in set(current) | set(published):
+        if current.get(key) != published.get(key):
+            changed.add(key[1])
+    return sorted(changed)
+
+
+def _published_reports(directory):
+    reports = load_reports(directory=directory)
+    if reports is None:  # published without a list of reports, every company is scored again
+        return pd.DataFrame(columns=['name', 'type', 'sha256'])
+    return reports
+
+
+# function to compute the results of the given reports, same steps as sections 2 and 4 of the notebook
+# returns (all_initiatives, all_percent, sentiment_df, bigram_df, trends) for the companies of these reports
+def score_reports(reports, ldamodel, id2word, bigram_mod, bigram_vectorizer, matcher=None, nlp=None):
+    if matcher is None:
+        matcher = build_matcher()
+    if nlp is None:
+        nlp = load_nlp()
+    sentences = pd.DataFrame(list(iter_sentences(reports)), columns=COLUMNS)
+
+    # 2.2 Lemmatization and Text Cleaning, with the phrase model of the full run
+    data_lemmatized = lemmatization(sentences['sentence'], bigram_mod, create_stopwords(),
+                                    allowed_postags=['NOUN', 'ADJ', 'VERB', 'ADV'], nlp=nlp)
+    corpus = [id2word.doc2bow(text) for text in data_lemmatized]
+
+    # 4.1 dominant topic of each sentence, inferred with the saved model
+    topics = ldamodel.show_topics(num_topics=ldamodel.num_topics, num_words=10, formatted=False)
+    dominant, _ = dominant_topics(document_topics(ldamodel, corpus))
+    sentences['esg'] = topic_labels(topics)[dominant]
+
+    all_percent = decarbonization_percent(sentences)
+
+    # 4.2 initiatives
+    all_initiatives = extract_initiatives(sentences, matcher)
+
+    # 4.3 bigrams, scored against the TF-IDF vocabulary and idf of the full run, lemmas are read from the cache
+    all_e_sentences = sentences[sentences['esg'] == 'E'].replace({np.nan: '-'})
+    all_e_sentences['lemma'] = lemmatize(all_e_sentences['sentence'], nlp=nlp)
+    bigram_df = top_bigrams(all_e_sentences, k=10, vectorizer=bigram_vectorizer)
+
+    # 4.4 sentiment, predicted with the models of each type of FI
+    scored = generate_sentiment_score(sentences[COLUMNS].copy(), matcher)
+    scored['predicted_sentiment_tree'], scored['predicted_sentiment_lr'] = predict_sentiment_by_type(scored)
+    sentiment_df = sentiment_by_company(scored)
+
+    # rollup cube of these companies by year
+    trends = company_trends(sentences, scored, matcher)
+
+    return all_initiatives, all_percent, sentiment_df, bigram_df, trends
+
+
+# function to find the model files of the last full run, raises FileNotFoundError naming every missing one
+# the committed model/ldamallet/lda_optimal14.model is an LdaMallet model, which gensim 4 cannot load, so the
+# gensim models have to be saved by a full run before the first incremental update
+def model_paths(types, model_path=None, id2word_path=ID2WORD_FILE):
+    if model_path is None:
+        try:
+            model_path = latest_optimal_model()
+        except FileNotFoundError:
+            model_path = os.path.join(MODEL_DIR, 'lda_gensim_optimal<number of topics>.model')
+    paths = [model_path, id2word_path, BIGRAM_MODEL_FILE, BIGRAM_VECTORIZER_FILE]
+    paths += [os.path.join(SENTIMENT_MODEL_DIR, fi + '.pkl') for fi in sorted(types)]
+    missing = [path for path in paths if not os.path.exists(path)]
+    if missing:
+        raise FileNotFoundError('the incremental update scores reports with the models of a full run, missing: %s. '
+                                'The LdaMallet model in %s cannot be loaded by gensim 4, run the full notebook or '
+                                'python -m pipeline.run once to save them' % (', '.join(missing), MODEL_DIR))
+    return model_path
+
+
+# function to replace the rows of the given companies with their new results
+def merge_results(published, updated, companies):
+    return [pd.concat([old[~old['name'].isin(companies)], new], ignore_index=True)
+            for old, new in zip(published, updated)]
+
+
+# function to run the incremental update and publish the merged results as a new version
+# returns the new version, or None when no report was added, changed or removed
+def update_results(fis=('ab', 'am', 'ins', 'pf'), model_path=None, id2word_path=ID2WORD_FILE, directory=RESULTS_DIR):
+    if current_version(directory) is None:
+        raise FileNotFoundError('no results published in %s, run the full notebook or python -m pipeline.run first'
+                                % directory)
+    reports = extract_reports(fis)
+    companies = changed_companies(reports, _published_reports(directory))
+    if not companies:
+        print('No new or changed reports')
+        return None
+    print('Updating %d companies: %s' % (len(companies), ', '.join(companies)))
+
+    model_path = model_paths(reports.loc[reports['name'].isin(companies), 'type'].unique(), model_path, id2word_path)
+    ldamodel = load_optimal_model(model_path)
+    id2word = corpora.Dictionary.load(id2word_path)
+    *updated, updated_trends = score_reports(reports[reports['name'].isin(companies)], ldamodel, id2word,
+                                             load_bigram_mod(), load_bigram_vectorizer())
+
+    merged = merge_results(load_results(directory=directory), updated, companies)
+    # the cube is only published when the previous version has one for the companies that did not change
+    trends = load_trends(directory=directory)
+    if trends is not None:
+        trends = merge_trends(trends, updated_trends, companies)
+    else:
+        print('The published results have no trends, run the full notebook or python -m pipeline.run to add them')
+    write_result_csvs(*merged, trends=trends, directory=directory)
+    return publish_results(*merged, reports=reports[['name', 'type', 'sha256']], trends=trends, directory=directory)
+
+
+# python -m pipeline.incremental scores new or changed reports and publishes the merged results
+if __name__ == '__main__':
+    print(update_results())
@@ -0,0 +1,33 @@
+import pandas as pd
+
+from pipeline.keywords import build_matcher
+
+
+# function to find the initiatives mentioned by each company, or by each company and year with by=('name', 'year')
+def extract_initiatives(data, matcher=None, by=('name',)):
+    if matcher is None:
+        matcher = build_matcher()
+
+    compiled_initiatives = []
+
+    for key, partial_df in data.groupby(list(by), sort=False, observed=True):
+        key = key if isinstance(key, tuple) else (key,)
+        type_of_fi = partial_df['type'].iloc[0]
+        filtered_initiatives = []
+
+        # initiatives are kept in order of first mention, then in the order of esg_initiatives.csv
+        for found in matcher.count_batch(partial_df['sentence'].astype(str), 'initiatives'):
+            for initiative in found:
+                if initiative not in filtered_initiatives:
+                    filtered_initiatives.append(initiative)
+
+        # To standardise the naming convention of HK Stock Exchange & Stock Exchange of HK
+        if 'Hong Kong Stock Exchange' in filtered_initiatives:
+            filtered_initiatives.remove('Hong Kong Stock Exchange')
+            if 'Stock Exchange of Hong Kong' not in filtered_initiatives:
+                filtered_initiatives.append('Stock Exchange of Hong Kong')
+        count = len(filtered_initiatives)
+        compiled_initiatives.append([*key, filtered_initiatives, count, type_of_fi])
+
+    initiatives_df = pd.DataFrame(compiled_initiatives, columns = list(by) + ['initiatives', 'count', 'type'])
+    return initiatives_df
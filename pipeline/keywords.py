@@ -0,0 +1,100 @@
+import re
+from collections import deque
+
+import pandas as pd
+
+# Keywords used by the sentiment score, matched against lowercased sentences
+esg_keywords = ['best-in-class', 'carbon footprint', 'carbon pricing', 'clean technology', 'engagement', 'environmental factors', 'esg integration', 'ethical investing', 'exclusions', 'negative screening', 'governance factors', 'green bond', 'greenwashing', 'human rights', 'impact investments', 'modern slavery', 'PRI', 'proxy voting',
+            'renewable energy', 'screening', 'social factors', 'SRI', 'stewardship', 'thematic investing', 'SDG', 'values-based investing', 'voting rights', 'biodiversity', 'carbon capture and storage', 'circular economy', 'climate action tracker', 'climate clocks', 'climate funds',
+            'climate transition benchmarks', 'greenhouse gas emissions', 'net zero carbon pledge and initiative', 'paris agreement', 'paris-aligned benchmarks',
+            'PFAS', 'scope 1', 'scope 2', 'scope 3', 'sdg funds', 'sin stocks', 'smart esg scores', 'social sustainability', 'stewardship code', 'stranded assets', 'sustainable investing', 'sustainability reporting',
+            'sustainable supply chains', 'sustainable technology', 'thermal coal exposure', 'triple bottom line', 'un global impact', 'green', 'low-carbon']
+climate_keywords = ['acidification', 'biofuel', 'carbon', 'carbon dioxide', 'climate', 'co2', 'climate change', 'decarbonisation', 'decarbonization', 'energy transmission', 'energy', 'energy transition', 'energy storage', 'emissions', 'emission control', 'fossil fuels', 'geothermal energy', 'geothermal', 'greenhouse gas', 'greenhouse', 'hydrocarbons', 'LNG', 'liquefied natural gas', 'ozone', 'renewable resources', 'sng', 'synthetic natural gas', 'thermal energy', 'thermal', 'wind power', 'wind']
+
+INITIATIVES_FILE = 'data/esg_initiatives.csv'
+
+
+# function to load the global initiatives & standards, matched case-sensitively against the original sentences
+def load_initiatives(path=INITIATIVES_FILE):
+    return pd.read_csv(path, usecols=['Initiative'])['Initiative'].tolist()
+
+
+# Aho-Corasick automaton over several named groups of keywords. A sentence is scanned once,
+# character by character, and every (possibly overlapping) occurrence of every keyword is counted,
+# which gives the same counts as sliding each keyword over the sentence separately
+class KeywordMatcher:
+
+    def __init__(self, groups):
+        self.patterns = []
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = {group: [[]] for group in groups}
+
+        # while the automaton is at the root, jump straight to the next character that can start a keyword of the group
+        self._skip = {group: re.compile('[' + ''.join(sorted({re.escape(k[0]) for k in keywords if k})) + ']')
+                      for group, keywords in groups.items()}
+
+        for group, keywords in groups.items():
+            for keyword in keywords:
+                pattern_id = len(self.patterns)
+                self.patterns.append(keyword)
+                node = 0
+                for ch in keyword:
+                    if ch not in self._goto[node]:
+                        self._goto.append({})
+                        self._fail.append(0)
+                        for out in self._out.values():
+                            out.append([])
+                        self._goto[node][ch] = len(self._goto) - 1
+                    node = self._goto[node][ch]
+                self._out[group][node].append(pattern_id)
+
+        # breadth first, so the failure link of a node is final before its children are visited
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(ch, 0)
+                for out in self._out.values():
+                    out[child] = out[child] + out[self._fail[child]]
+
+    # function to count the occurrences of each keyword of a group in one text, returns {pattern_id: count}
+    def count(self, text, group):
+        goto, fail, out, skip = self._goto, self._fail, self._out[group], self._skip[group].search
+        counts = {}
+        node = 0
+        i = 0
+        n = len(text)
+        while i < n:
+            if not node:
+                m = skip(text, i)
+                if m is None:
+                    break
+                i = m.start()
+            ch = text[i]
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for pattern_id in out[node]:
+                counts[pattern_id] = counts.get(pattern_id, 0) + 1
+            i += 1
+        return counts
+
+    # function to scan a batch of texts, returns one {keyword: count} per text in the order the keywords were given
+    def count_batch(self, texts, group):
+        results = []
+        for text in texts:
+            counts = self.count(text, group)
+            results.append({self.patterns[i]: counts[i] for i in sorted(counts)})
+        return results
+
+
+# function to build the matcher shared by sentiment scoring and initiative extraction
+def build_matcher(initiatives=None):
+    if initiatives is None:
+        initiatives = load_initiatives()
+    return KeywordMatcher({'sentiment': esg_keywords + climate_keywords, 'initiatives': initiatives})
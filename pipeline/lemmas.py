@@ -0,0 +1,113 @@
+import hashlib
+import json
+import os
+import sqlite3
+
+import gensim
+import spacy
+from gensim.utils import simple_preprocess
+
+# (lemma, part of speech) of every token of a sentence, cached per raw sentence. Each sentence is parsed once, the
+# LDA corpus and the bigram analysis are both built from the cached tokens
+LEMMA_CACHE = 'cache/lemmas.sqlite'
+
+# Number of texts sent to each spaCy process at a time
+BATCH_SIZE = 1000
+
+
+# parser and ner do not set lemmas or part of speech tags, so they are disabled for both analyses
+# (python -m benchmarks.lemma_check compares the bigrams with those of the parser enabled, as the notebook used to)
+def load_nlp(disable=('parser', 'ner')):
+    return spacy.load("en_core_web_sm", disable=list(disable))
+
+
+# cache key covers the spaCy model as well as the sentence, so upgrading en_core_web_sm invalidates old lemmas
+def _key(nlp, sentence):
+    return hashlib.sha1((nlp.meta['name'] + '-' + nlp.meta['version'] + '\0' + sentence).encode('utf-8')).hexdigest()
+
+
+def _connect(cache_path):
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    conn = sqlite3.connect(cache_path)
+    conn.execute('CREATE TABLE IF NOT EXISTS lemmas (key TEXT PRIMARY KEY, tokens TEXT)')
+    return conn
+
+
+# function to get [(lemma, pos), ...] for every sentence, only sentences missing from the cache are parsed
+# parsing uses nlp.pipe in batches across n_process processes
+def analyse(sentences, nlp=None, n_process=os.cpu_count(), batch_size=BATCH_SIZE, cache_path=LEMMA_CACHE):
+    if nlp is None:
+        nlp = load_nlp()
+    texts = [str(sentence) for sentence in sentences]
+    keys = [_key(nlp, text) for text in texts]
+
+    conn = _connect(cache_path)
+    found = {}
+    unique_keys = list(set(keys))
+    for i in range(0, len(unique_keys), 900):  # sqlite limits the number of parameters per query
+        chunk = unique_keys[i:i + 900]
+        query = 'SELECT key, tokens FROM lemmas WHERE key IN (%s)' % ','.join('?' * len(chunk))
+        found.update(conn.execute(query, chunk))
+
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in found and key not in missing:
+            missing[key] = text
+
+    if missing:
+        rows = []
+        docs = nlp.pipe(missing.values(), batch_size=batch_size, n_process=n_process if len(missing) > batch_size else 1)
+        for key, doc in zip(missing, docs):
+            tokens = json.dumps([[token.lemma_, token.pos_] for token in doc])
+            found[key] = tokens
+            rows.append((key, tokens))
+            if len(rows) == batch_size:
+                conn.executemany('INSERT OR REPLACE INTO lemmas VALUES (?, ?)', rows)
+                conn.commit()
+                rows = []
+        conn.executemany('INSERT OR REPLACE INTO lemmas VALUES (?, ?)', rows)
+        conn.commit()
+    conn.close()
+
+    return [json.loads(found[key]) for key in keys]
+
+
+# function for gensim preprocessing of the lemmas of each sentence, [[(word, pos), ...], ...]
+def lemma_words(docs):
+    return [[(word, pos) for lemma, pos in doc for word in simple_preprocess(lemma, deacc=True)] for doc in docs]
+
+
+# function to get the tokens of each sentence for the LDA corpus from its lemma words: stopwords are removed, bigrams
+# of bigram_mod joined and only words of the allowed parts of speech kept (a joined bigram is always kept)
+def lda_tokens(words, bigram_mod, stop_words, allowed_postags=['NOUN', 'ADJ', 'VERB', 'ADV']):
+    stop_words = set(stop_words)
+    texts = []
+    for doc in words:
+        doc = [(word, pos) for word, pos in doc if word not in stop_words]
+        tokens, i = [], 0
+        for token, score in bigram_mod.analyze_sentence([word for word, pos in doc]):
+            if score is not None:  # a bigram joins two words (the phrase model has no connector words)
+                tokens.append(token)
+                i += 2
+            else:
+                if doc[i][1] in allowed_postags:
+                    tokens.append(token)
+                i += 1
+        texts.append(tokens)
+    return texts
+
+
+# function for lemmatization (LDA), takes in the raw sentences and the phrase model and stopwords of 2.2
+def lemmatization(sentences, bigram_mod, stop_words, allowed_postags=['NOUN', 'ADJ', 'VERB', 'ADV'], **kwargs):
+    return lda_tokens(lemma_words(analyse(sentences, **kwargs)), bigram_mod, stop_words, allowed_postags)
+
+
+def tokenize(sentence):
+    gen = gensim.utils.simple_preprocess(sentence, deacc=True)
+    return ' '.join(gen)
+
+
+# function for lemmatization (bigram analysis), converts words of each sentence into their simplest form
+def lemmatize(sentences, **kwargs):
+    docs = analyse(sentences, **kwargs)
+    return [tokenize(' '.join(lemma for lemma, pos in doc if lemma not in ['-PRON-'])) for doc in docs]
@@ -0,0 +1,91 @@
+import json
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# resource is Unix only, on Windows CPU time and peak memory come from psutil when it is installed,
+# otherwise from the Python process itself and tracemalloc
+try:
+    import resource
+except ImportError:
+    resource = None
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Run reports of python -m pipeline.run, one per run, eg. cache/run/reports/20261018-013120.json
+REPORT_DIR = 'cache/run/reports'
+
+# Steps measured in this process, in the order they finished
+steps = []
+
+
+def _cpu_seconds():
+    if resource is not None:
+        usage = [resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)]
+        return sum(u.ru_utime + u.ru_stime for u in usage)
+    if psutil is not None:
+        # the children times are only counted on Unix, on Windows this is the CPU time of this process
+        times = psutil.Process().cpu_times()
+        return times.user + times.system + times.children_user + times.children_system
+    return time.process_time()
+
+
+# peak resident memory of this process and of the largest worker process it has waited for (ru_maxrss is in KB).
+# Without resource: the peak working set of this process on Windows (psutil), its current RSS elsewhere, or
+# without psutil the peak of the Python allocations traced by tracemalloc since the first tracked step
+def peak_rss_mb():
+    if resource is not None:
+        return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                   resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) / 1024
+    if psutil is not None:
+        memory = psutil.Process().memory_info()
+        return getattr(memory, 'peak_wset', memory.rss) / 1024 ** 2
+    return tracemalloc.get_traced_memory()[1] / 1024 ** 2
+
+
+class Step:
+
+    def __init__(self, name):
+        self.name = name
+        self.items = None
+
+
+# context manager to measure a step: wall time, CPU time (including the worker processes it starts, once they
+# exit) and peak RSS. The peak is the highest of the process so far, so it belongs to the step when each step
+# runs in its own process (python -m pipeline.run) and is an upper bound in a notebook kernel.
+# Set step.items to the number of reports, sentences or companies it processed
+#
+#     with track('lemmatize') as step:
+#         data_lemmatized = lemmatization(data_words_bigrams)
+#         step.items = len(data_lemmatized)
+@contextmanager
+def track(name):
+    step = Step(name)
+    if resource is None and psutil is None and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    start, start_cpu = time.time(), _cpu_seconds()
+    try:
+        yield step
+    finally:
+        steps.append({'step': name, 'seconds': round(time.time() - start, 3),
+                      'cpu_seconds': round(_cpu_seconds() - start_cpu, 3), 'peak_rss_mb': round(peak_rss_mb(), 1),
+                      'items': step.items})
+
+
+# function to write a run report, returns its path
+def write_report(report, directory=REPORT_DIR):
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, time.strftime('%Y%m%d-%H%M%S') + '.json')
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=1)
+    return path
+
+
+def print_steps(rows):
+    print('%-14s %8s %10s %8s %10s %10s' % ('stage', 'status', 'seconds', 'cpu', 'peak MB', 'items'))
+    for row in rows:
+        print('%-14s %8s %10.2f %8.2f %10.1f %10s' % (row['step'], row.get('status', ''), row['seconds'],
+                                                      row['cpu_seconds'], row['peak_rss_mb'], row['items']))
@@ -0,0 +1,224 @@
+import ast
+import hashlib
+import os
+import shutil
+import time
+import uuid
+
+import pandas as pd
+import pyarrow as pa
+
+RESULTS_DIR = 'results'
+
+# Every published version of the results is a folder of Arrow IPC files, results/bundles/<version>/<table>.arrow,
+# and results/CURRENT holds the name of the version the dashboard should read
+BUNDLE_DIR = 'bundles'
+CURRENT_FILE = 'CURRENT'
+
+# Number of published versions kept, older ones are removed after a new version is published
+KEEP_VERSIONS = 3
+
+_name = pa.dictionary(pa.int32(), pa.string())
+_type = pa.dictionary(pa.int8(), pa.string())
+
+SCHEMAS = {
+    'initiatives': pa.schema([('name', _name), ('initiatives', pa.list_(pa.string())),
+                              ('count', pa.int32()), ('type', _type)]),
+    'percent': pa.schema([('name', _name), ('total_sent', pa.int64()), ('e_sent', pa.int64()),
+                          ('percent', pa.float64()), ('type', _type)]),
+    'sentiment': pa.schema([('name', _name), ('sentiment_score', pa.float64()), ('type', _type),
+                            ('predicted_sentiment_tree', pa.float64()), ('predicted_sentiment_lr', pa.float64())]),
+    'bigrams': pa.schema([('name', _name),
+                          ('bigramarray', pa.list_(pa.struct([('bigram', pa.string()), ('score', pa.float64())])))]),
+    # sha256 of every report the results were computed from, used by the incremental update
+    'reports': pa.schema([('name', _name), ('type', _type), ('sha256', pa.string())]),
+    # rollup cube of the results by company and year (see pipeline/trends.py) and the averages of each FI and year,
+    # *_yoy is the change since the previous year, null for the first one. For the averages it is the change over
+    # the companies with reports in both years (see fi_year_averages)
+    'trends': pa.schema([('name', _name), ('type', _type), ('year', pa.int16()), ('total_sent', pa.int64()),
+                         ('e_sent', pa.int64()), ('percent', pa.float64()), ('sentiment', pa.float64()),
+                         ('initiative_count', pa.int32()), ('percent_yoy', pa.float64()),
+                         ('sentiment_yoy', pa.float64()), ('initiative_count_yoy', pa.float64())]),
+    'fi_trends': pa.schema([('type', _type), ('year', pa.int16()), ('companies', pa.int32()),
+                            ('percent', pa.float64()), ('sentiment', pa.float64()), ('initiative_count', pa.float64()),
+                            ('percent_yoy', pa.float64()), ('sentiment_yoy', pa.float64()),
+                            ('initiative_count_yoy', pa.float64())]),
+}
+
+RESULT_TABLES = ['initiatives', 'percent', 'sentiment', 'bigrams']
+
+
+def _column(field, values):
+    if pa.types.is_dictionary(field.type):
+        return pa.array(pd.Categorical(values.astype(str)), field.type)
+    if field.name == 'bigramarray':
+        values = [[{'bigram': w, 'score': float(s)} for w, s in bigrams] for bigrams in values]
+        return pa.array(values, field.type)
+    return pa.Array.from_pandas(values, type=field.type)
+
+
+def _table(name, df):
+    schema = SCHEMAS[name]
+    return pa.table([_column(field, df[field.name].reset_index(drop=True)) for field in schema], schema=schema)
+
+
+# function to average the cube of each type of FI and year over its companies, like the FI averages of the dashboard
+# the change since the previous year of the type of FI only counts the companies with reports in both years, so
+# companies joining or leaving the average do not show up as a change (null when no company is in both years)
+def fi_year_averages(trends):
+    measures = ['percent', 'sentiment', 'initiative_count']
+    averages = trends.groupby(['type', 'year'], observed=True).agg(
+        companies=('name', 'size'), **{measure: (measure, 'mean') for measure in measures}).reset_index()
+    averages = averages.sort_values(['type', 'year'], ignore_index=True)
+
+    years = averages[['type', 'year']].assign(previous=averages.groupby('type', observed=True)['year'].shift())
+    years = years.dropna(subset=['previous']).astype({'previous': int})
+    current = trends[['name', 'type', 'year'] + measures].merge(years, on=['type', 'year'])
+    previous = trends[['name', 'type', 'year'] + measures].rename(columns={'year': 'previous'})
+    both = current.merge(previous, on=['name', 'type', 'previous'], suffixes=('', '_previous'))
+    for measure in measures:
+        both[measure + '_yoy'] = both[measure] - both[measure + '_previous']
+    changes = both.groupby(['type', 'year'], observed=True)[[measure + '_yoy' for measure in measures]].mean()
+    return averages.merge(changes.reset_index(), on=['type', 'year'], how='left')
+
+
+def _write_table(table, path):
+    # uncompressed, so the dashboard can memory-map the columns without copying them
+    with pa.OSFile(path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+
+# function to publish a new version of the results read by the dashboard
+# the tables are written to a temporary folder that is renamed into place, then CURRENT is replaced,
+# so a running dashboard only ever sees complete versions
+# reports (name, type, sha256 of each report) and trends (the cube of pipeline/trends.py) are optional
+def publish_results(all_initiatives, all_percent, sentiment_df, bigram_df, reports=None, trends=None,
+                    directory=RESULTS_DIR, keep=KEEP_VERSIONS):
+    frames = {'initiatives': all_initiatives, 'percent': all_percent, 'sentiment': sentiment_df, 'bigrams': bigram_df}
+    if reports is not None:
+        frames['reports'] = reports
+    if trends is not None:
+        frames['trends'] = trends
+        frames['fi_trends'] = fi_year_averages(trends)
+    bundle_dir = os.path.join(directory, BUNDLE_DIR)
+    tmp_dir = os.path.join(bundle_dir, '.tmp-' + uuid.uuid4().hex)
+    os.makedirs(tmp_dir)
+
+    sha = hashlib.sha1()
+    for name, df in frames.items():
+        path = os.path.join(tmp_dir, name + '.arrow')
+        _write_table(_table(name, df), path)
+        with open(path, 'rb') as f:
+            sha.update(f.read())
+
+    version = time.strftime('%Y%m%d-%H%M%S') + '-' + sha.hexdigest()[:8]
+    if os.path.exists(os.path.join(bundle_dir, version)):  # same results published within the same second
+        shutil.rmtree(tmp_dir)
+    else:
+        os.rename(tmp_dir, os.path.join(bundle_dir, version))
+
+    tmp_current = os.path.join(directory, CURRENT_FILE + '.tmp')
+    with open(tmp_current, 'w') as f:
+        f.write(version + '\n')
+    os.replace(tmp_current, os.path.join(directory, CURRENT_FILE))
+
+    # dashboard workers still reading an older version keep their memory maps of removed files
+    versions = sorted(v for v in os.listdir(bundle_dir) if not v.startswith('.'))
+    for old in versions[:max(0, len(versions) - keep)]:
+        if old != version:
+            shutil.rmtree(os.path.join(bundle_dir, old), ignore_errors=True)
+    return version
+
+
+# function to get the name of the current version, None if no results were published yet
+def current_version(directory=RESULTS_DIR):
+    try:
+        with open(os.path.join(directory, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+# function to open one table of a version, memory-mapped so only the columns that are read are paged in
+def load_table(name, version=None, directory=RESULTS_DIR):
+    if version is None:
+        version = current_version(directory)
+        if version is None:
+            raise FileNotFoundError('no results published in %s' % directory)
+    source = pa.memory_map(os.path.join(directory, BUNDLE_DIR, version, name + '.arrow'), 'r')
+    return pa.ipc.open_file(source).read_all()
+
+
+# function to read a published version back as the data frames given to publish_results
+def load_results(version=None, directory=RESULTS_DIR):
+    if version is None:
+        version = current_version(directory)
+    frames = []
+    for name in RESULT_TABLES:
+        df = load_table(name, version, directory).to_pandas()
+        for column in df.select_dtypes('category').columns:
+            df[column] = df[column].astype(str)
+        frames.append(df)
+    all_initiatives, all_percent, sentiment_df, bigram_df = frames
+    all_initiatives['initiatives'] = [list(initiatives) for initiatives in all_initiatives['initiatives']]
+    bigram_df['bigramarray'] = [[(w['bigram'], w['score']) for w in bigrams] for bigrams in bigram_df['bigramarray']]
+    return all_initiatives, all_percent, sentiment_df, bigram_df
+
+
+# function to read the sha256 of every report of a published version, None if it was published without them
+def load_reports(version=None, directory=RESULTS_DIR):
+    try:
+        df = load_table('reports', version, directory).to_pandas()
+    except FileNotFoundError:
+        return None
+    return df.astype({'name': str, 'type': str})
+
+
+# function to read the cube of a published version, None if it was published without one
+def load_trends(version=None, directory=RESULTS_DIR):
+    try:
+        df = load_table('trends', version, directory).to_pandas()
+    except FileNotFoundError:
+        return None
+    return df.astype({'name': str, 'type': str, 'year': int})
+
+
+# function to write the result csvs in the same format as the notebook, each csv is replaced atomically
+def write_result_csvs(all_initiatives, all_percent, sentiment_df, bigram_df, trends=None, directory=RESULTS_DIR):
+    csvs = [(all_initiatives, 'all_initiatives.csv', False), (all_percent, 'all_percent.csv', True),
+            (sentiment_df, 'sentiment_score.csv', True), (bigram_df, 'bigram_df.csv', False)]
+    if trends is not None:
+        csvs.append((trends, 'trends.csv', False))
+    for df, filename, index in csvs:
+        path = os.path.join(directory, filename)
+        df.to_csv(path + '.tmp', index=index)
+        os.replace(path + '.tmp', path)
+
+
+# function to read the result csvs written by the notebook, with the lists of initiatives and bigrams parsed
+def read_result_csvs(directory=RESULTS_DIR):
+    all_initiatives = pd.read_csv(os.path.join(directory, 'all_initiatives.csv'))
+    all_initiatives['initiatives'] = all_initiatives['initiatives'].apply(ast.literal_eval)
+    all_percent = pd.read_csv(os.path.join(directory, 'all_percent.csv'), index_col=0)
+    sentiment_df = pd.read_csv(os.path.join(directory, 'sentiment_score.csv'), index_col=0)
+    bigram_df = pd.read_csv(os.path.join(directory, 'bigram_df.csv'))
+    bigram_df['bigramarray'] = bigram_df['bigramarray'].apply(ast.literal_eval)
+    return all_initiatives, all_percent, sentiment_df, bigram_df
+
+
+# function to read results/trends.csv, None if the results were computed without it
+def read_trends_csv(directory=RESULTS_DIR):
+    try:
+        return pd.read_csv(os.path.join(directory, 'trends.csv'))
+    except FileNotFoundError:
+        return None
+
+
+# python -m pipeline.results publishes the result csvs as a new version
+# the csvs are computed from the reports of the current version, so its list of reports is published again with them
+if __name__ == '__main__':
+    trends = read_trends_csv()
+    if trends is None:
+        print('No results/trends.csv, publishing without trends. Run the full notebook or python -m pipeline.run to add them')
+    print(publish_results(*read_result_csvs(), reports=load_reports(), trends=trends))
@@ -0,0 +1,342 @@
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+import pandas as pd
+from gensim import corpora
+
+from pipeline.bigrams import fit_bigram_vectorizer, save_bigram_vectorizer, top_bigrams
+from pipeline.cleaning import create_bigram_mod, create_stopwords, save_bigram_mod
+from pipeline.extraction import DATA_DIR, extract_reports, hash_pdf, list_reports
+from pipeline.initiatives import extract_initiatives
+from pipeline.keywords import INITIATIVES_FILE, build_matcher
+from pipeline.lemmas import LEMMA_CACHE, analyse, lda_tokens, lemma_words, lemmatize, load_nlp
+from pipeline.metrics import print_steps, steps, track, write_report
+from pipeline.results import publish_results, write_result_csvs
+from pipeline.sentence_index import SENTENCE_INDEX_DIR, build_sentence_index
+from pipeline.sentences import SENTENCE_STORE, load_sentences, write_sentence_store
+from pipeline.sentiment import (generate_sentiment_score, predict_sentiment_by_type, save_sentiment_models,
+                                sentiment_by_company, train_sentiment_models)
+from pipeline.topics import (ID2WORD_FILE, compute_coherence_values, decarbonization_percent, document_topics,
+                             dominant_topics, load_optimal_model, save_optimal_model, topic_labels)
+from pipeline.trends import company_trends
+
+# Checkpoints of every stage: <stage>.pkl holds its output and <stage>.json the fingerprint it was computed from
+RUN_DIR = 'cache/run'
+
+# Parameters of each stage, part of its fingerprint
+PARAMS = {
+    'extract': {'fis': ['ab', 'am', 'ins', 'pf']},
+    'clean': {'allowed_postags': ['NOUN', 'ADJ', 'VERB', 'ADV']},
+    'lda': {'start': 2, 'limit': 20, 'step': 2, 'patience': None},
+    'bigrams': {'k': 10},
+}
+
+# Files read by a stage besides the outputs of the stages it depends on, part of its fingerprint
+FILES = {
+    'clean': ['data/companylabels.csv'],
+    'initiatives': [INITIATIVES_FILE],
+    'bigrams': ['data/companylabels.csv'],
+}
+
+
+# ---------- Stages ----------
+# each stage takes the outputs of the stages it depends on and its parameters, and returns its own output
+
+# 2.1 Text Extraction: sentences are written to the memory-mapped sentence store
+def extract(inputs, fis):
+    reports = extract_reports(fis)
+    write_sentence_store(reports)
+    return {'store': SENTENCE_STORE, 'reports': reports[['name', 'type', 'sha256']]}
+
+
+# 2.2 Lemmatization: every sentence is parsed once into the lemma cache, read by the LDA corpus and the bigram analysis
+def lemmatize_sentences(inputs):
+    sentences = load_sentences(inputs['extract']['store'], columns=['sentence']).sentence
+    return {'cache': LEMMA_CACHE, 'sentences': len(analyse(sentences))}
+
+
+# 2.2 Text Cleaning: gensim preprocessing of the lemmas, stopwords removal, bigrams and parts of speech
+def clean(inputs, allowed_postags):
+    sentences = load_sentences(inputs['extract']['store'], columns=['sentence']).sentence
+    words = lemma_words(analyse(sentences))
+    bigram_mod = create_bigram_mod([[word for word, pos in doc] for doc in words])
+    save_bigram_mod(bigram_mod)
+    return lda_tokens(words, bigram_mod, create_stopwords(), allowed_postags)
+
+
+# 2.3 Creating Corpus
+def corpus(inputs):
+    id2word = corpora.Dictionary(inputs['clean'])
+    id2word.save(ID2WORD_FILE)
+    return {'id2word': id2word, 'corpus': [id2word.doc2bow(text) for text in inputs['clean']]}
+
+
+# 3.2 LDA Model: the topic count with the highest coherence is saved
+def lda(inputs, start, limit, step, patience):
+    id2word, corpus = inputs['corpus']['id2word'], inputs['corpus']['corpus']
+    model_list, coherence_values = compute_coherence_values(dictionary=id2word, corpus=corpus,
+                                                            texts=inputs['clean'], start=start, limit=limit,
+                                                            step=step, patience=patience)
+    max_index = int(np.argmax(coherence_values))
+    optimal_model = model_list[max_index]
+    print("Optimal Coherence Score: " + str(coherence_values[max_index]))
+    print("Optimal num topics: " + str(optimal_model.num_topics))
+    return {'model': save_optimal_model(optimal_model, optimal_model.num_topics), 'coherence_values': coherence_values}
+
+
+# 4.1 LDA model: dominant topic of each sentence, whether it is decarbonization related, and the percentage per company
+def assign(inputs):
+    optimal_model = load_optimal_model(inputs['lda']['model'])
+    topics = optimal_model.show_topics(num_topics=optimal_model.num_topics, num_words=10, formatted=False)
+    dominant, _ = dominant_topics(document_topics(optimal_model, inputs['corpus']['corpus']))
+    esg = topic_labels(topics)[dominant]
+    all_sentences = load_sentences(inputs['extract']['store'], columns=['name', 'type'])
+    all_sentences['esg'] = esg
+    return {'esg': esg, 'all_percent': decarbonization_percent(all_sentences)}
+
+
+# 4.2 Extract Global Initiatives & Standards
+def initiatives(inputs):
+    all_sentences = load_sentences(inputs['extract']['store'], columns=['name', 'sentence', 'type'])
+    return extract_initiatives(all_sentences, build_matcher())
+
+
+# 4.3 Bigram Analysis
+def bigrams(inputs, k):
+    all_sentences = load_sentences(inputs['extract']['store'], columns=['name', 'sentence'])
+    all_e_sentences = all_sentences[inputs['assign']['esg'] == 'E'].replace({np.nan: '-'})
+    all_e_sentences['lemma'] = lemmatize(all_e_sentences['sentence'], nlp=load_nlp())
+    bigram_vectorizer = fit_bigram_vectorizer(all_e_sentences.lemma)
+    save_bigram_vectorizer(bigram_vectorizer)
+    return top_bigrams(all_e_sentences, k=k, vectorizer=bigram_vectorizer)
+
+
+# Similar Sentences: vector index of the decarbonization related sentences for the dashboard
+def sentence_index(inputs):
+    all_sentences = load_sentences(inputs['extract']['store'], columns=['name', 'sentence', 'year', 'type'])
+    all_e_sentences = all_sentences[inputs['assign']['esg'] == 'E']
+    version = build_sentence_index(all_e_sentences)
+    return {'directory': SENTENCE_INDEX_DIR, 'version': version, 'sentences': len(all_e_sentences)}
+
+
+# 4.4 Calculate Sentiment Score
+def sentiment(inputs):
+    matcher = build_matcher()
+    frames = {fi: generate_sentiment_score(load_sentences(inputs['extract']['store'], fi=fi), matcher)
+              for fi in ['ab', 'am', 'pf', 'ins']}
+    frames = {fi: df for fi, df in frames.items() if len(df)}
+    sentiment_predictions = train_sentiment_models(frames)
+    save_sentiment_models(sentiment_predictions)
+    for fi, df in frames.items():
+        df['predicted_sentiment_tree'] = sentiment_predictions[fi]['tree']
+        df['predicted_sentiment_lr'] = sentiment_predictions[fi]['lr']
+    return pd.concat([sentiment_by_company(df) for df in frames.values()], ignore_index=True)
+
+
+# Trends: disclosure percentage, sentiment and initiative count of every company and year, the sentiment of each
+# sentence is predicted with the models saved by the sentiment stage
+def trends(inputs):
+    all_sentences = load_sentences(inputs['extract']['store'], columns=['name', 'sentence', 'year', 'type'])
+    all_sentences['esg'] = inputs['assign']['esg']
+    all_sentences['predicted_sentiment_tree'] = predict_sentiment_by_type(all_sentences)[0]
+    return company_trends(all_sentences, all_sentences, build_matcher())
+
+
+# results are written to the csvs and published as a new version for the dashboard
+def publish(inputs):
+    results = (inputs['initiatives'], inputs['assign']['all_percent'], inputs['sentiment'], inputs['bigrams'])
+    write_result_csvs(*results, trends=inputs['trends'])
+    return publish_results(*results, reports=inputs['extract']['reports'], trends=inputs['trends'])
+
+
+# number of items (reports, sentences, models or companies) in the output of a stage, len of the output otherwise
+ITEMS = {
+    'extract': lambda output: len(output['reports']),
+    'lemmatize': lambda output: output['sentences'],
+    'corpus': lambda output: len(output['corpus']),
+    'lda': lambda output: len(output['coherence_values']),
+    'assign': lambda output: len(output['esg']),
+    'sentence_index': lambda output: output['sentences'],
+    'publish': lambda output: 1,
+}
+
+# stage: (stages it depends on, function), in an order where every stage comes after its dependencies
+STAGES = {
+    'extract': ([], extract),
+    'lemmatize': (['extract'], lemmatize_sentences),
+    'clean': (['lemmatize', 'extract'], clean),
+    'corpus': (['clean'], corpus),
+    'lda': (['corpus', 'clean'], lda),
+    'assign': (['lda', 'corpus', 'extract'], assign),
+    'initiatives': (['extract'], initiatives),
+    'bigrams': (['assign', 'extract'], bigrams),
+    'sentence_index': (['assign', 'extract'], sentence_index),
+    'sentiment': (['extract'], sentiment),
+    'trends': (['extract', 'assign', 'sentiment'], trends),
+    'publish': (['extract', 'assign', 'initiatives', 'bigrams', 'sentiment', 'trends'], publish),
+}
+
+
+# ---------- Checkpoints ----------
+def _hash_file(path):
+    sha = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+# function to fingerprint a stage from its parameters, input files and the checkpoints of the stages it depends on
+# the reports themselves are the input files of extract, so adding or changing a pdf reruns the pipeline
+def fingerprint(name, params, dependencies):
+    files = list(FILES.get(name, []))
+    if name == 'extract':
+        files += [path for _, path, _, _ in list_reports(params['fis'], DATA_DIR)[0]]
+    payload = {'stage': name, 'params': params, 'dependencies': dependencies,
+               'files': {path: hash_pdf(path) if path.endswith('.pdf') else _hash_file(path) for path in files}}
+    return hashlib.sha1(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _paths(name, run_dir):
+    return os.path.join(run_dir, name + '.pkl'), os.path.join(run_dir, name + '.json')
+
+
+# function to read the checkpoint of a stage, None if it never completed
+def load_checkpoint(name, run_dir=RUN_DIR):
+    output_path, meta_path = _paths(name, run_dir)
+    if not (os.path.exists(output_path) and os.path.exists(meta_path)):
+        return None
+    with open(meta_path) as f:
+        return json.load(f)
+
+
+def load_output(name, run_dir=RUN_DIR):
+    with open(_paths(name, run_dir)[0], 'rb') as f:
+        return pickle.load(f)
+
+
+# function to run one stage in a worker process and checkpoint its output
+# every run gets a new checkpoint id, which is what the fingerprints of the stages after it depend on
+def run_stage(name, fingerprint_, params, run_dir=RUN_DIR):
+    dependencies, func = STAGES[name]
+    inputs = {dependency: load_output(dependency, run_dir) for dependency in dependencies}
+    with track(name) as step:
+        output = func(inputs, **params)
+        step.items = ITEMS.get(name, len)(output)
+
+    output_path, meta_path = _paths(name, run_dir)
+    with open(output_path + '.tmp', 'wb') as f:
+        pickle.dump(output, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(output_path + '.tmp', output_path)
+    meta = dict(steps[-1], fingerprint=fingerprint_, checkpoint=uuid.uuid4().hex)
+    with open(meta_path + '.tmp', 'w') as f:
+        json.dump(meta, f, indent=1)
+    os.replace(meta_path + '.tmp', meta_path)
+    return meta
+
+
+# function to find a stage and every stage it depends on
+def _required(stages):
+    required = set()
+    pending = list(stages)
+    while pending:
+        name = pending.pop()
+        if name not in required:
+            required.add(name)
+            pending.extend(STAGES[name][0])
+    return required
+
+
+# function to run the pipeline, stages are started as soon as the stages they depend on are done, so independent
+# stages (eg. initiatives and sentiment next to the LDA model) run in parallel. A stage whose fingerprint matches
+# its checkpoint is skipped, forced stages always run (and so does every stage after them)
+# every stage runs in a new process so its peak memory is its own, the measurements are written to a run report
+def run_pipeline(until=None, force=(), max_parallel=None, params=None, run_dir=RUN_DIR):
+    params = {name: dict(PARAMS.get(name, {}), **(params or {}).get(name, {})) for name in STAGES}
+    stages = [name for name in STAGES if until is None or name in _required(until)]
+    max_parallel = max_parallel or len(stages)
+    os.makedirs(run_dir, exist_ok=True)
+
+    checkpoints = {}
+    rows = {}
+    running = {}
+    start = time.time()
+    try:
+        while len(checkpoints) < len(stages):
+            started = {name for name, _ in running.values()}
+            skipped = False
+            for name in stages:
+                dependencies = STAGES[name][0]
+                if name in checkpoints or name in started or any(d not in checkpoints for d in dependencies):
+                    continue
+                if len(running) >= max_parallel:
+                    break
+                fingerprint_ = fingerprint(name, params[name], {d: checkpoints[d] for d in dependencies})
+                checkpoint = load_checkpoint(name, run_dir)
+                if name not in force and checkpoint is not None and checkpoint['fingerprint'] == fingerprint_:
+                    print('Skipped %s (unchanged)' % name)
+                    checkpoints[name] = checkpoint['checkpoint']
+                    rows[name] = {'step': name, 'status': 'skipped', 'seconds': 0.0, 'cpu_seconds': 0.0,
+                                  'peak_rss_mb': 0.0, 'items': checkpoint.get('items')}
+                    skipped = True
+                    break  # stages after it may be ready now
+                print('Started %s' % name)
+                executor = ProcessPoolExecutor(max_workers=1)
+                running[executor.submit(run_stage, name, fingerprint_, params[name], run_dir)] = (name, executor)
+                started.add(name)
+            if skipped:
+                continue
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, executor = running.pop(future)
+                executor.shutdown()
+                meta = future.result()
+                checkpoints[name] = meta['checkpoint']
+                rows[name] = dict(meta, status='ran')
+                print('Finished %s in %.1fs' % (name, meta['seconds']))
+    finally:
+        for _, executor in running.values():
+            executor.shutdown(cancel_futures=True)
+
+    rows = [{key: rows[name][key] for key in ['step', 'status', 'seconds', 'cpu_seconds', 'peak_rss_mb', 'items']}
+            for name in stages if name in rows]
+    report = {'started': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(start)),
+              'seconds': round(time.time() - start, 3), 'params': params, 'stages': rows}
+    print_steps(rows)
+    print('Run report: %s' % write_report(report, os.path.join(run_dir, 'reports')))
+    return checkpoints
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m pipeline.run',
+                                     description='Run the decarbonization pipeline, skipping unchanged stages.')
+    parser.add_argument('--until', nargs='+', choices=list(STAGES), metavar='STAGE',
+                        help='only run these stages and the stages they depend on')
+    parser.add_argument('--force', nargs='+', default=[], choices=list(STAGES) + ['all'], metavar='STAGE',
+                        help='rerun these stages even if unchanged (all: every stage)')
+    parser.add_argument('--max-parallel', type=int, default=None, help='maximum number of stages run at once')
+    parser.add_argument('--topics', nargs=3, type=int, metavar=('START', 'LIMIT', 'STEP'),
+                        help='numbers of topics compared by the lda stage, range(START, LIMIT, STEP)')
+    parser.add_argument('--patience', type=int, default=None,
+                        help='stop the topic sweep after this many topic counts without a better coherence')
+    args = parser.parse_args(argv)
+
+    lda_params = {'patience': args.patience}
+    if args.topics:
+        lda_params.update(zip(['start', 'limit', 'step'], args.topics))
+    force = list(STAGES) if 'all' in args.force else args.force
+    run_pipeline(until=args.until, force=force, max_parallel=args.max_parallel, params={'lda': lda_params})
+
+
+# python -m pipeline.run
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+import os
+import pickle
+import shutil
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.decomposition import TruncatedSVD
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from pipeline.results import CURRENT_FILE, KEEP_VERSIONS, current_version
+
+# Vector index of the decarbonization related sentences, searched by the Similar Sentences tab of the dashboard
+# Every build is a folder results/sentence_index/<version>, and results/sentence_index/CURRENT holds the name of the
+# build the dashboard should search, like the published results (see pipeline/results.py)
+SENTENCE_INDEX_DIR = 'results/sentence_index'
+
+# Sentences are TF-IDF vectors (words and word pairs) reduced to this many dimensions with truncated SVD (LSA)
+DIMENSIONS = 96
+
+# Sentences are grouped into lists around k-means centroids and stored list after list, a search only scans the
+# NPROBE lists closest to the query. Filters matching at most EXACT_LIMIT sentences are scanned in full instead
+NPROBE = 16
+EXACT_LIMIT = 200000
+KMEANS_SAMPLE = 100000
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return (vectors / np.maximum(norms, 1e-12)).astype(np.float32)
+
+
+def _number_of_lists(n_sentences):
+    return int(np.clip(4 * np.sqrt(n_sentences), 1, 4096))
+
+
+# function to find the closest centroid of every vector, in batches to keep the similarity matrix small
+def _assign_lists(vectors, centroids, batch_size=100000):
+    return np.concatenate([np.argmax(vectors[i:i + batch_size] @ centroids.T, axis=1)
+                           for i in range(0, len(vectors), batch_size)])
+
+
+def _table(df):
+    return pa.table({'name': pa.array(pd.Categorical(df['name'].astype(str))),
+                     'type': pa.array(pd.Categorical(df['type'].astype(str))),
+                     'year': pa.array(df['year'].astype(int).to_numpy(), pa.int16()),
+                     'sentence': pa.array(df['sentence'].astype(str).tolist(), pa.string())})
+
+
+# function to build the index from sentences with name, type, year and sentence columns, eg. all_e_sentences
+# the index is written to a temporary folder that becomes a new version once complete, returns the version
+def build_sentence_index(df, directory=SENTENCE_INDEX_DIR, dimensions=DIMENSIONS, seed=0, keep=KEEP_VERSIONS):
+    df = df[['name', 'type', 'year', 'sentence']].reset_index(drop=True)
+    vectorizer = TfidfVectorizer(stop_words='english', ngram_range=(1, 2), min_df=2, sublinear_tf=True,
+                                 dtype=np.float32)
+    tfidf = vectorizer.fit_transform(df['sentence'].astype(str))
+    svd = TruncatedSVD(n_components=min(dimensions, tfidf.shape[1] - 1), random_state=seed)
+    vectors = _normalize(svd.fit_transform(tfidf))
+
+    rng = np.random.RandomState(seed)
+    sample = vectors[rng.choice(len(vectors), min(len(vectors), KMEANS_SAMPLE), replace=False)]
+    kmeans = MiniBatchKMeans(n_clusters=min(_number_of_lists(len(vectors)), len(sample)), random_state=seed,
+                             batch_size=4096, n_init=3).fit(sample)
+    centroids = _normalize(kmeans.cluster_centers_)
+    lists = _assign_lists(vectors, centroids)
+    order = np.argsort(lists, kind='stable')
+    offsets = np.searchsorted(lists[order], np.arange(len(centroids) + 1))
+
+    tmp_dir = os.path.join(directory, '.tmp-' + uuid.uuid4().hex)
+    os.makedirs(tmp_dir)
+    np.save(os.path.join(tmp_dir, 'vectors.npy'), vectors[order])
+    np.save(os.path.join(tmp_dir, 'centroids.npy'), centroids)
+    np.save(os.path.join(tmp_dir, 'offsets.npy'), offsets)
+    with pa.OSFile(os.path.join(tmp_dir, 'sentences.arrow'), 'wb') as sink:
+        table = _table(df.iloc[order])
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    with open(os.path.join(tmp_dir, 'model.pkl'), 'wb') as f:
+        pickle.dump({'vectorizer': vectorizer, 'svd': svd}, f)
+
+    version = time.strftime('%Y%m%d-%H%M%S') + '-' + uuid.uuid4().hex[:8]
+    os.rename(tmp_dir, os.path.join(directory, version))
+
+    tmp_current = os.path.join(directory, CURRENT_FILE + '.tmp')
+    with open(tmp_current, 'w') as f:
+        f.write(version + '\n')
+    os.replace(tmp_current, os.path.join(directory, CURRENT_FILE))
+
+    # dashboard workers still searching an older version keep their memory maps of removed files
+    versions = sorted(v for v in os.listdir(directory)
+                      if not v.startswith('.') and os.path.isdir(os.path.join(directory, v)))
+    for old in versions[:max(0, len(versions) - keep)]:
+        if old != version:
+            shutil.rmtree(os.path.join(directory, old), ignore_errors=True)
+    return version
+
+
+def _codes(dictionary, values):
+    positions = {value: i for i, value in enumerate(dictionary)}
+    return np.array([positions[v] for v in values if v in positions], dtype=np.int64)
+
+
+# One version of the index opened for searching, vectors and sentences are memory-mapped so only the scanned rows
+# are paged in
+class SentenceIndex:
+
+    def __init__(self, version, directory=SENTENCE_INDEX_DIR):
+        self.version = version
+        directory = os.path.join(directory, version)
+        self.vectors = np.load(os.path.join(directory, 'vectors.npy'), mmap_mode='r')
+        self.centroids = np.load(os.path.join(directory, 'centroids.npy'))
+        self.offsets = np.load(os.path.join(directory, 'offsets.npy'))
+        with open(os.path.join(directory, 'model.pkl'), 'rb') as f:
+            model = pickle.load(f)
+        self.vectorizer, self.svd = model['vectorizer'], model['svd']
+
+        source = pa.memory_map(os.path.join(directory, 'sentences.arrow'), 'r')
+        table = pa.ipc.open_file(source).read_all()
+        self.sentences = table.column('sentence')
+        name = table.column('name').combine_chunks()
+        fi = table.column('type').combine_chunks()
+        self.names, self.name_codes = name.dictionary.to_pylist(), name.indices.to_numpy()
+        self.types, self.type_codes = fi.dictionary.to_pylist(), fi.indices.to_numpy()
+        self.years = table.column('year').to_numpy()
+
+        # rows of each company, so a search filtered by company only reads that company's sentences
+        self._company_rows = np.argsort(self.name_codes, kind='stable')
+        self._company_offsets = np.searchsorted(self.name_codes[self._company_rows], np.arange(len(self.names) + 1))
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def embed(self, text):
+        return _normalize(self.svd.transform(self.vectorizer.transform([text])))[0]
+
+    def _keep(self, rows, type_codes, years):
+        keep = np.ones(len(rows), dtype=bool)
+        if type_codes is not None:
+            keep &= np.isin(self.type_codes[rows], type_codes)
+        if years is not None:
+            keep &= np.isin(self.years[rows], years)
+        return rows[keep]
+
+    # exact search over the sentences of the selected companies
+    def _search_companies(self, query, company_codes, type_codes, years):
+        rows = np.concatenate([self._company_rows[self._company_offsets[c]:self._company_offsets[c + 1]]
+                               for c in company_codes] + [np.empty(0, dtype=np.int64)])
+        rows = self._keep(np.sort(rows), type_codes, years)
+        return rows, self.vectors[rows] @ query
+
+    # approximate search over the lists closest to the query, more lists are scanned until k sentences match
+    def _search_lists(self, query, k, company_codes, type_codes, years, nprobe):
+        closest = np.argsort(-(self.centroids @ query))
+        found_rows, found_scores = [], []
+        found, start = 0, 0
+        while start < len(closest) and (start == 0 or found < k):
+            for c in closest[start:start + nprobe]:
+                lo, hi = self.offsets[c], self.offsets[c + 1]
+                rows = np.arange(lo, hi)
+                if company_codes is not None:
+                    rows = rows[np.isin(self.name_codes[lo:hi], company_codes)]
+                rows = self._keep(rows, type_codes, years)
+                if len(rows) == hi - lo:  # nothing filtered out, the list is one contiguous slice
+                    scores = self.vectors[lo:hi] @ query
+                else:
+                    scores = self.vectors[rows] @ query
+                found_rows.append(rows)
+                found_scores.append(scores)
+                found += len(rows)
+            start += nprobe
+            nprobe *= 2
+        if not found_rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        return np.concatenate(found_rows), np.concatenate(found_scores)
+
+    # function to find the k sentences most similar to a text, optionally only of some companies, types of FI
+    # and years. Returns a DataFrame of name, type, year, sentence and cosine similarity, most similar first
+    def search(self, text, k=10, companies=None, types=None, years=None, nprobe=NPROBE):
+        return self.search_vector(self.embed(text), k, companies, types, years, nprobe)
+
+    def search_vector(self, query, k=10, companies=None, types=None, years=None, nprobe=NPROBE):
+        company_codes = _codes(self.names, companies) if companies else None
+        type_codes = _codes(self.types, types) if types else None
+        years = np.asarray(years, dtype=self.years.dtype) if years else None
+
+        selected = None
+        if company_codes is not None:
+            selected = int(sum(self._company_offsets[c + 1] - self._company_offsets[c] for c in company_codes))
+        if selected is not None and selected <= EXACT_LIMIT:
+            rows, scores = self._search_companies(query, company_codes, type_codes, years)
+        else:
+            rows, scores = self._search_lists(query, k, company_codes, type_codes, years, nprobe)
+
+        if len(rows) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            rows, scores = rows[top], scores[top]
+        order = np.argsort(-scores)
+        rows, scores = rows[order], scores[order]
+        return pd.DataFrame({'name': [self.names[c] for c in self.name_codes[rows]],
+                             'type': [self.types[c] for c in self.type_codes[rows]],
+                             'year': self.years[rows].astype(int),
+                             'sentence': self.sentences.take(pa.array(rows, pa.int64())).to_pylist(),
+                             'similarity': scores.astype(float)})
+
+
+# function to open a version of the index (by default the current one), None if it was not built yet
+def load_sentence_index(version=None, directory=SENTENCE_INDEX_DIR):
+    if version is None:
+        version = current_version(directory)
+        if version is None:
+            return None
+    return SentenceIndex(version, directory)
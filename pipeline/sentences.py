@@ -0,0 +1,139 @@
+import os
+import re
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Sentences of all reports are stored as one Arrow IPC file, which downstream stages memory-map
+SENTENCE_STORE = 'cache/sentences.arrow'
+
+# Number of sentences written per record batch
+CHUNK_SIZE = 50000
+
+COLUMNS = ['name', 'sentence', 'year', 'type']
+
+
+# function takes in a report and yields its individual sentences
+def convert_pdf_into_sentences(text):
+
+    # remove unnecessary spaces and line breaks
+    text = re.sub(r'\x0c\x0c|\x0c', "", str(text))
+    text = re.sub('\n ', '', str(text))
+    text = re.sub('\n', ' ', str(text))
+    text = ' '.join(text.split())
+    text = " " + text + "  "
+    text = text.replace("\n", " ")
+    if "”" in text: text = text.replace(".”", "”.")
+    if "\"" in text: text = text.replace(".\"", "\".")
+    if "!" in text: text = text.replace("!\"", "\"!")
+    if "?" in text: text = text.replace("?\"", "\"?")
+    text = text.replace(".", ".<stop>")
+    text = text.replace("?", "?<stop>")
+    text = text.replace("!", "!<stop>")
+    text = text.replace("<prd>", ".")
+    sentences = text.split("<stop>")
+
+    # filter for sentences with more than 100 characters
+    for s in sentences[:-1]:
+        if len(s) > 100:
+            yield s.strip()
+
+
+# function to stream (name, sentence, year, type) for every sentence of every report
+def iter_sentences(reports):
+    for name, text, year, fi in reports[COLUMNS].itertuples(index=False):
+        for sentence in convert_pdf_into_sentences(text):
+            yield name, sentence, year, fi
+
+
+# name, year and type are dictionary encoded against the full set of reports, so every
+# record batch shares one dictionary and the columns load back as pandas categoricals
+def _dictionaries(reports):
+    return {
+        'name': pa.array(sorted(reports['name'].unique()), pa.string()),
+        'year': pa.array(sorted(int(y) for y in reports['year'].unique()), pa.int16()),
+        'type': pa.array(sorted(reports['type'].unique()), pa.string()),
+    }
+
+
+def _schema(dictionaries):
+    return pa.schema([
+        ('name', pa.dictionary(pa.int32(), dictionaries['name'].type)),
+        ('sentence', pa.string()),
+        ('year', pa.dictionary(pa.int32(), dictionaries['year'].type)),
+        ('type', pa.dictionary(pa.int32(), dictionaries['type'].type)),
+    ])
+
+
+def _record_batch(rows, dictionaries, positions, schema):
+    names, sentences, years, fis = zip(*rows)
+    arrays = [
+        pa.DictionaryArray.from_arrays(pa.array([positions['name'][n] for n in names], pa.int32()), dictionaries['name']),
+        pa.array(sentences, pa.string()),
+        pa.DictionaryArray.from_arrays(pa.array([positions['year'][int(y)] for y in years], pa.int32()), dictionaries['year']),
+        pa.DictionaryArray.from_arrays(pa.array([positions['type'][t] for t in fis], pa.int32()), dictionaries['type']),
+    ]
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+# function to split reports (output of extract_reports) into sentences and write them in chunks to the store
+# only one chunk of sentences is held in memory at a time; returns the number of sentences written
+def write_sentence_store(reports, path=SENTENCE_STORE, chunk_size=CHUNK_SIZE):
+    dictionaries = _dictionaries(reports)
+    positions = {col: {v: i for i, v in enumerate(arr.to_pylist())} for col, arr in dictionaries.items()}
+    schema = _schema(dictionaries)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    total = 0
+    with pa.OSFile(tmp_path, 'wb') as sink, pa.ipc.new_file(sink, schema) as writer:
+        rows = []
+        for row in iter_sentences(reports):
+            rows.append(row)
+            if len(rows) == chunk_size:
+                writer.write_batch(_record_batch(rows, dictionaries, positions, schema))
+                total += len(rows)
+                rows = []
+        if rows:
+            writer.write_batch(_record_batch(rows, dictionaries, positions, schema))
+            total += len(rows)
+    os.replace(tmp_path, path)
+    return total
+
+
+# function to memory-map the store as an Arrow table, nothing is read into RAM until a column is used
+def open_sentence_store(path=SENTENCE_STORE, columns=None):
+    table = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+    return table.select(columns) if columns else table
+
+
+# function to stream the store batch by batch, eg. for stages that only need the sentence column
+def iter_sentence_batches(path=SENTENCE_STORE, columns=None):
+    reader = pa.ipc.open_file(pa.memory_map(path, 'r'))
+    for i in range(reader.num_record_batches):
+        batch = reader.get_batch(i)
+        yield batch.select(columns) if columns else batch
+
+
+# function to load the store as a DataFrame with categorical name/type/year, optionally for one type of FI
+# only the given columns are read, the filter by type of FI is applied before any of them is copied
+def load_sentences(path=SENTENCE_STORE, fi=None, columns=None):
+    table = open_sentence_store(path)
+    if fi is not None:
+        keep = pc.equal(table['type'].cast(pa.string()), fi)
+        table = (table.select(columns) if columns else table).filter(keep)
+    elif columns:
+        table = table.select(columns)
+    df = table.to_pandas()
+    # to keep groupby('name') limited to the companies of this FI
+    for col in df.select_dtypes('category').columns:
+        df[col] = df[col].cat.remove_unused_categories()
+    return df
+
+
+# function takes in reports and breaks them up into individual sentences
+def clean_text(df):
+    rows = [(name, sentence, year) for name, text, year in df[['name', 'sentence', 'year']].itertuples(index=False)
+            for sentence in convert_pdf_into_sentences(text)]
+    return pd.DataFrame(rows, columns=['name', 'sentence', 'year'])
@@ -0,0 +1,139 @@
+import math
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from sklearn import tree
+from sklearn.feature_extraction.text import CountVectorizer
+from sklearn.linear_model import LinearRegression
+from sklearn.metrics import mean_squared_error
+from sklearn.model_selection import train_test_split
+from textblob import TextBlob
+
+from pipeline.keywords import build_matcher
+
+# Number of sentences scored by TextBlob per task
+POLARITY_BATCH_SIZE = 5000
+
+# Bag of words, regression tree and linear regression of each type of FI, eg. model/sentiment/ab.pkl
+SENTIMENT_MODEL_DIR = 'model/sentiment'
+
+
+def _polarity_batch(sentences):
+    return [TextBlob(x).sentiment.polarity for x in sentences]
+
+
+# function to compute TextBlob polarity of every sentence, in batches across processes
+def polarity(sentences, max_workers=None, batch_size=POLARITY_BATCH_SIZE):
+    sentences = list(sentences)
+    batches = [sentences[i:i + batch_size] for i in range(0, len(sentences), batch_size)]
+    if len(batches) <= 1:
+        return [p for batch in batches for p in _polarity_batch(batch)]
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return [p for batch in executor.map(_polarity_batch, batches) for p in batch]
+
+
+def generate_sentiment_score(df, matcher=None, max_workers=None):
+    if matcher is None:
+        matcher = build_matcher()
+
+    df['sentence'] = [str(x).lower() for x in df['sentence']]
+    df['tokenize'] = [x.split(' ') for x in df['sentence']]
+    df['sentiment'] = polarity(df['sentence'], max_workers=max_workers)
+
+    # one pass of the keyword matcher per sentence instead of sliding every keyword over it
+    word_collection = matcher.count_batch(df['sentence'], 'sentiment')
+    df['freq'] = [sum(dic.values()) for dic in word_collection]
+    df['unique_keywords'] = [list(dic) for dic in word_collection]
+    df['words_collection'] = word_collection
+
+    df['sentiment_score'] = [sentiment if freq == 0 else sentiment + math.log(1 + freq * len(keywords))
+                             for sentiment, freq, keywords in zip(df['sentiment'], df['freq'], df['unique_keywords'])]
+    df['optimism'] = np.select([df['sentiment_score'] < 0, df['sentiment_score'] < 0.5],
+                               ['pessimistic', 'neutral'], 'optimistic')
+    return df
+
+
+# Creation of bag of words model, returns the fitted CountVectorizer and a sparse sentences x 1000 matrix
+# sentences can be any iterable, eg. a column streamed from the sentence store
+def bag_of_words_model(sentences):
+    cv = CountVectorizer(max_features=1000)
+    return cv, cv.fit_transform(sentences)
+
+
+# function to fit a model on 70% of the sentences, report its RMSE on the other 30%
+# and predict the sentiment score of every sentence (in the original order), returns (predicted, rmse, model)
+def _fit_predict(model, x, y, name):
+    x_train_1, x_test_1, y_train_1, y_test_1 = train_test_split(x, y, train_size=0.7, test_size=0.3, random_state=1)
+    model.fit(x_train_1, y_train_1)
+    rmse = np.sqrt(mean_squared_error(y_test_1, model.predict(x_test_1)))
+    print('The root mean squared error of {} is {}'.format(name, rmse))
+    return model.predict(x), rmse, model
+
+
+# Regression Tree: predicting future sentiment score
+def decision_tree_final(x, y):
+    return _fit_predict(tree.DecisionTreeRegressor(), x, y, 'Regression Tree')
+
+
+# Linear Regression: predicting future sentiment score
+def linear_regression(x, y):
+    return _fit_predict(LinearRegression(), x, y, 'Linear Regression')
+
+
+def _train_fi(sentences, sentiment_score):
+    cv, x = bag_of_words_model(sentences)
+    y = np.asarray(sentiment_score, dtype=np.float64)
+    predicted_tree, rmse_tree, tree_model = decision_tree_final(x, y)
+    predicted_lr, rmse_lr, lr_model = linear_regression(x, y)
+    return {'tree': predicted_tree, 'lr': predicted_lr, 'rmse_tree': rmse_tree, 'rmse_lr': rmse_lr,
+            'models': {'bag_of_words': cv, 'tree': tree_model, 'lr': lr_model}}
+
+
+# function to train the regression tree and linear regression of each type of FI, one FI per process
+# frames maps type of FI to its output of generate_sentiment_score
+def train_sentiment_models(frames, max_workers=None):
+    if max_workers is None:
+        max_workers = min(len(frames), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {fi: executor.submit(_train_fi, df['sentence'].tolist(), df['sentiment_score'].to_numpy())
+                   for fi, df in frames.items()}
+        return {fi: future.result() for fi, future in futures.items()}
+
+
+# function to save the models of each type of FI returned by train_sentiment_models
+def save_sentiment_models(predictions, directory=SENTIMENT_MODEL_DIR):
+    os.makedirs(directory, exist_ok=True)
+    for fi, prediction in predictions.items():
+        with open(os.path.join(directory, fi + '.pkl'), 'wb') as f:
+            pickle.dump(prediction['models'], f)
+
+
+def load_sentiment_models(fi, directory=SENTIMENT_MODEL_DIR):
+    with open(os.path.join(directory, fi + '.pkl'), 'rb') as f:
+        return pickle.load(f)
+
+
+# function to predict the sentiment score of sentences with saved models, returns (tree, linear regression)
+def predict_sentiment(models, sentences):
+    x = models['bag_of_words'].transform(sentences)
+    return models['tree'].predict(x), models['lr'].predict(x)
+
+
+# function to predict the sentiment score of sentences of any type of FI, each with the saved models of its type
+# returns (tree, linear regression) in the order of the sentences
+def predict_sentiment_by_type(df, directory=SENTIMENT_MODEL_DIR):
+    predicted_tree, predicted_lr = np.full(len(df), np.nan), np.full(len(df), np.nan)
+    for fi, positions in df.groupby('type', observed=True).indices.items():
+        models = load_sentiment_models(fi, directory)
+        predicted_tree[positions], predicted_lr[positions] = predict_sentiment(models, df['sentence'].iloc[positions])
+    return predicted_tree, predicted_lr
+
+
+# function to average the sentiment scores of each company, same columns as results/sentiment_score.csv
+# df is the output of generate_sentiment_score with the predicted_sentiment_tree/lr columns added
+def sentiment_by_company(df):
+    columns = ['sentiment_score', 'predicted_sentiment_tree', 'predicted_sentiment_lr']
+    sentiment_df = df.groupby(['name', 'type'], observed=True)[columns].mean().reset_index()
+    return sentiment_df[['name', 'sentiment_score', 'type', 'predicted_sentiment_tree', 'predicted_sentiment_lr']]
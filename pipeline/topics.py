@@ -0,0 +1,212 @@
+import glob
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sps
+from gensim import matutils
+from gensim.matutils import dirichlet_expectation
+from gensim.models import LdaModel, LdaMulticore
+
+from pipeline.coherence import INDEX_FILE, load_or_build_index
+
+# Optimal models are saved next to the LDAMallet model
+MODEL_DIR = 'model/ldamallet'
+
+# Dictionary of the corpus the optimal model was trained on
+ID2WORD_FILE = os.path.join(MODEL_DIR, 'id2word.dict')
+
+# Defaults for the in-process LDA backend
+LDA_PARAMS = {'passes': 10, 'iterations': 100, 'chunksize': 2000, 'random_state': 100}
+
+# Set once per worker process by _init_worker, so the corpus is not pickled for every topic count
+_worker = {}
+
+
+def _init_worker(dictionary, corpus):
+    _worker.update(dictionary=dictionary, corpus=corpus)
+
+
+# function to train one LDA model, workers > 1 uses LdaMulticore for that model
+def train_lda(corpus, id2word, num_topics, workers=1, **params):
+    params = dict(LDA_PARAMS, **params)
+    if workers > 1:
+        return LdaMulticore(corpus=corpus, id2word=id2word, num_topics=num_topics, workers=workers, **params)
+    return LdaModel(corpus=corpus, id2word=id2word, num_topics=num_topics, **params)
+
+
+def _train(num_topics, workers, params):
+    return train_lda(_worker['corpus'], _worker['dictionary'], num_topics, workers=workers, **params)
+
+
+# function to compute coherence value of each model
+# models for different topic counts are trained at the same time, one per process, and the next topic count starts
+# as soon as a model finishes. Models are scored in topic count order; with patience set, no further topic count is
+# started once that many in a row fail to beat the best coherence so far (models still training are kept).
+# Patience can only skip topic counts that have not started, so it saves nothing when max_workers covers them all.
+# Every model is scored (c_v) against one co-occurrence index of the texts, saved next to id2word.dict
+def compute_coherence_values(dictionary, corpus, texts, limit, start=2, step=3, max_workers=None,
+                             patience=None, workers_per_model=1, index_file=INDEX_FILE, **params):
+    if max_workers is None:
+        max_workers = max(1, (os.cpu_count() or 1) // workers_per_model)
+    topic_counts = list(range(start, limit, step))
+
+    coherence_values = []
+    model_list = []
+    best = None
+    since_best = 0
+    stopped = False
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                             initargs=(dictionary, corpus)) as executor:
+        futures = [executor.submit(_train, n, workers_per_model, params) for n in topic_counts[:max_workers]]
+        index = load_or_build_index(texts, dictionary, index_file)  # built while the first models train
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            while len(model_list) < len(futures) and futures[len(model_list)].done():
+                model = futures[len(model_list)].result()
+                coherence = index.coherence(model)
+                model_list.append(model)
+                coherence_values.append(coherence)
+                if best is None or coherence > best:
+                    best = coherence
+                    since_best = 0
+                else:
+                    since_best += 1
+                if patience is not None and since_best >= patience:
+                    stopped = True
+            # a worker that finished a model takes the next topic count, until the sweep stops
+            for _ in done:
+                if not stopped and len(futures) < len(topic_counts):
+                    future = executor.submit(_train, topic_counts[len(futures)], workers_per_model, params)
+                    futures.append(future)
+                    pending.add(future)
+    return model_list, coherence_values
+
+
+# function to save the optimal model, eg. model/ldamallet/lda_gensim_optimal14.model
+def save_optimal_model(model, num_topics, directory=MODEL_DIR):
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, 'lda_gensim_optimal%d.model' % num_topics)
+    model.save(path)
+    return path
+
+
+def load_optimal_model(path):
+    return LdaModel.load(path)
+
+
+# function to find the most recently saved optimal model
+def latest_optimal_model(directory=MODEL_DIR):
+    paths = glob.glob(os.path.join(directory, 'lda_gensim_optimal*.model'))
+    if not paths:
+        raise FileNotFoundError('no optimal model saved in %s' % directory)
+    return max(paths, key=os.path.getmtime)
+
+
+# function to determine whether a topic is related to decarbonization
+def find_e_topics(topics):
+    esg_words = ['carbon', 'footprint', 'clean', 'environment', 'esg', 'green', 'sustainability',
+                  'energy', 'emission', 'climate', 'responsible', 'geothermal',
+                  'environmental','decarbonization', 'decarbonisation', 'greenhouse','renewable', 'ozone']
+
+    # Check for 'E' topics
+    e_topic = []
+    for n in range(len(topics)):
+        words = [x[0] for x in topics[n][1]]
+        for w in words:
+            if w in esg_words:
+                e_topic.append(n)
+                break
+
+    return e_topic  # returns topic number that are related to decarbonization
+
+
+# variational inference of LdaModel.inference, run on a whole chunk at once with sparse matrix products
+# instead of one document at a time. A document stops updating once its gamma converges, as in gensim
+def _batched_inference(ldamodel, chunk):
+    doc_term = matutils.corpus2csc(chunk, num_terms=ldamodel.num_terms, num_docs=len(chunk)).T.tocsr()
+    rows = np.repeat(np.arange(len(chunk)), np.diff(doc_term.indptr))
+    exp_elog_beta = ldamodel.expElogbeta.astype(np.float64)
+    beta_nz = exp_elog_beta[:, doc_term.indices].T  # (non-zero entries x topics)
+    alpha = np.asarray(ldamodel.alpha, dtype=np.float64)
+
+    gamma = ldamodel.random_state.gamma(100., 1. / 100., (len(chunk), ldamodel.num_topics))
+    exp_elog_theta = np.exp(dirichlet_expectation(gamma))
+    phinorm = np.einsum('nk,nk->n', exp_elog_theta[rows], beta_nz) + 1e-100
+    active = np.ones(len(chunk), dtype=bool)
+    for _ in range(ldamodel.iterations):
+        weights = sps.csr_matrix((doc_term.data / phinorm, doc_term.indices, doc_term.indptr), shape=doc_term.shape)
+        new_gamma = alpha + exp_elog_theta * (weights @ exp_elog_beta.T)
+        meanchange = np.abs(new_gamma - gamma).mean(axis=1)
+        gamma[active] = new_gamma[active]
+        active &= meanchange >= ldamodel.gamma_threshold
+        if not active.any():
+            break
+        exp_elog_theta = np.exp(dirichlet_expectation(gamma))
+        phinorm = np.einsum('nk,nk->n', exp_elog_theta[rows], beta_nz) + 1e-100
+    return gamma
+
+
+# function to get the document-topic matrix (documents x topics) of a corpus, inferred chunksize documents at a time
+def document_topics(ldamodel, corpus, chunksize=10000):
+    num_topics = ldamodel.num_topics
+    corpus = corpus if hasattr(corpus, '__len__') else list(corpus)
+    doc_topics = np.zeros((len(corpus), num_topics), dtype=np.float32)
+    for start in range(0, len(corpus), chunksize):
+        chunk = corpus[start:start + chunksize]
+        if isinstance(ldamodel, LdaModel):  # includes LdaMulticore
+            gamma = _batched_inference(ldamodel, chunk)
+            doc_topics[start:start + len(chunk)] = gamma / gamma.sum(axis=1, keepdims=True)
+        else:  # eg. LdaMallet, which infers the whole chunk in one call
+            doc_topics[start:start + len(chunk)] = matutils.corpus2dense(ldamodel[chunk], num_topics, len(chunk)).T
+    return doc_topics
+
+
+# function to get the dominant topic of each document and its contribution
+def dominant_topics(doc_topics):
+    dominant = doc_topics.argmax(axis=1)
+    return dominant, doc_topics[np.arange(len(dominant)), dominant]
+
+
+# function to assign dominant topic
+def format_topics_sentences(ldamodel, corpus, texts, chunksize=10000):
+    dominant, contribution = dominant_topics(document_topics(ldamodel, corpus, chunksize))
+
+    # keywords are looked up once per topic instead of once per sentence
+    keywords = np.array([", ".join([word for word, prop in ldamodel.show_topic(n)]) for n in range(ldamodel.num_topics)],
+                        dtype=object)
+
+    sent_topics_df = pd.DataFrame({'Dominant_Topic': dominant,
+                                   'Perc_Contribution': np.round(contribution.astype(np.float64), 4),
+                                   'Topic_Keywords': keywords[dominant]})
+
+    # Add original text to the end of the output
+    sent_topics_df[0] = pd.Series(texts)
+    return(sent_topics_df)
+
+
+# function to label each topic number 'E' (decarbonization related) or 'SG'
+def topic_labels(topics):
+    e_topic = find_e_topics(topics)
+    labels = np.full(len(topics), 'SG', dtype=object)
+    labels[e_topic] = 'E'
+    return labels
+
+
+# function that determines which sentences are decarbonization related
+def assign_esg(df, topics):
+    labels = topic_labels(topics)
+    new_df = df
+    new_df['esg'] = labels[new_df['dominant_topic'].to_numpy(dtype=np.int64)]
+    return new_df
+
+
+# function to calculate the percentage of decarbonization related sentences of each company
+# df has one row per sentence with its name, type and esg label, same columns as results/all_percent.csv
+def decarbonization_percent(df):
+    e_sent = (df['esg'] == 'E').rename('e_sent')
+    all_percent = e_sent.groupby([df['name'], df['type']], observed=True).agg(total_sent='size', e_sent='sum').reset_index()
+    all_percent['percent'] = all_percent['e_sent'] / all_percent['total_sent'] * 100
+    return all_percent[['name', 'total_sent', 'e_sent', 'percent', 'type']]
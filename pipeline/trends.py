@@ -0,0 +1,57 @@
+import pandas as pd
+
+from pipeline.initiatives import extract_initiatives
+
+# Rollup cube of the results by company, year and type of FI, one row per year a company published reports in,
+# with the change of each measure since the previous report year of the company. The averages of each type of FI
+# and year are added up from it when the results are published (see pipeline/results.py)
+KEYS = ['name', 'type', 'year']
+MEASURES = ['percent', 'sentiment', 'initiative_count']
+TREND_COLUMNS = KEYS + ['total_sent', 'e_sent'] + MEASURES + [measure + '_yoy' for measure in MEASURES]
+
+
+def _keys(df):
+    return df.astype({'name': str, 'type': str, 'year': int})
+
+
+# function to calculate the percentage of decarbonization related sentences of each company and year
+# df has one row per sentence with its name, type, year and esg label
+def percent_by_year(df):
+    e_sent = (df['esg'] == 'E').rename('e_sent')
+    percent = e_sent.groupby([df[key] for key in KEYS], observed=True).agg(total_sent='size', e_sent='sum')
+    percent = _keys(percent.reset_index())
+    percent['percent'] = percent['e_sent'] / percent['total_sent'] * 100
+    return percent
+
+
+# function to average the predicted sentiment score (regression tree, as shown by the dashboard) of each company and year
+def sentiment_by_year(df):
+    sentiment = df.groupby(KEYS, observed=True)['predicted_sentiment_tree'].mean().rename('sentiment')
+    return _keys(sentiment.reset_index())
+
+
+# function to count the initiatives mentioned by each company in the reports of each year
+def initiatives_by_year(df, matcher=None):
+    initiatives = extract_initiatives(df, matcher, by=('name', 'year'))
+    return _keys(initiatives[KEYS + ['count']].rename(columns={'count': 'initiative_count'}))
+
+
+# function to build the rollup cube of the companies in sentences
+# sentences has one row per sentence with its name, type, year, sentence and esg label (eg. df_with_assigned_topics),
+# scored has the predicted_sentiment_tree of every sentence (eg. the output of generate_sentiment_score of each FI)
+def company_trends(sentences, scored, matcher=None):
+    trends = percent_by_year(sentences)
+    trends = trends.merge(sentiment_by_year(scored), on=KEYS, how='left')
+    trends = trends.merge(initiatives_by_year(sentences, matcher), on=KEYS, how='left')
+    trends['initiative_count'] = trends['initiative_count'].fillna(0).astype(int)
+
+    trends = trends.sort_values(KEYS, ignore_index=True)
+    for measure in MEASURES:
+        trends[measure + '_yoy'] = trends.groupby(['name', 'type'])[measure].diff()
+    return trends[TREND_COLUMNS]
+
+
+# function to replace the rows of the given companies in the cube with their new rows
+def merge_trends(trends, updated, companies):
+    merged = pd.concat([trends[~trends['name'].isin(companies)], updated], ignore_index=True)
+    return merged.sort_values(KEYS, ignore_index=True)